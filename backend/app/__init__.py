@@ -3,6 +3,8 @@ CivicLens Flask Application Factory
 """
 import os
 from flask import Flask
+from flask_caching import Cache
+from flask_compress import Compress
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
@@ -16,6 +18,8 @@ db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 bcrypt = Bcrypt()
+cache = Cache()
+compress = Compress()
 
 
 def create_app(config_class=None):
@@ -24,6 +28,10 @@ def create_app(config_class=None):
     """
     app = Flask(__name__)
     
+    # orjson-backed JSON for jsonify() and request parsing
+    from app.utils.serialization import ORJSONProvider
+    app.json = ORJSONProvider(app)
+    
     # Load configuration
     if config_class is None:
         config_class = get_config()
@@ -38,6 +46,8 @@ def create_app(config_class=None):
     migrate.init_app(app, db)
     jwt.init_app(app)
     bcrypt.init_app(app)
+    cache.init_app(app)
+    compress.init_app(app)
     
     # Configure CORS
     CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
@@ -68,6 +78,29 @@ def create_app(config_class=None):
     def missing_token_callback(error):
         return {'message': 'Authorization required', 'error': 'authorization_required'}, 401
     
+    @jwt.token_in_blocklist_loader
+    def check_token_revoked(jwt_header, jwt_payload):
+        from app.utils.cache import is_token_revoked
+        return is_token_revoked(jwt_payload['jti'])
+    
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return {'message': 'Token has been revoked', 'error': 'token_revoked'}, 401
+    
+    # Current role/active state from the in-process claims cache, so role
+    # changes and deactivations apply without waiting for the token to expire
+    @jwt.user_lookup_loader
+    def load_user_claims(jwt_header, jwt_payload):
+        from app.utils.cache import get_user_claims
+        claims = get_user_claims(int(jwt_payload['sub']))
+        if claims is None or not claims['is_active']:
+            return None
+        return claims
+    
+    @jwt.user_lookup_error_loader
+    def user_lookup_error_callback(jwt_header, jwt_payload):
+        return {'message': 'Account not found or inactive', 'error': 'user_inactive'}, 401
+    
     # Health check endpoint
     @app.route('/health')
     def health_check():
@@ -2,12 +2,19 @@
 Admin API Routes
 Dashboard analytics, officer management, and system administration
 """
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
-from sqlalchemy import func, text
-from app import db, bcrypt
+from flask_jwt_extended import jwt_required, get_current_user
+from sqlalchemy import case, func, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, raiseload
+from app import db, cache
 from app.models.models import Complaint, User, StatusUpdate, Department
+from app.utils.cache import (
+    DASHBOARD_CACHE_KEY, invalidate_dashboard, invalidate_officer_dashboard, invalidate_track,
+    invalidate_user
+)
+from app.utils.security import hash_password
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -19,8 +26,8 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        claims = get_jwt()
-        if claims.get('role') != 'admin':
+        claims = get_current_user()
+        if claims['role'] != 'admin':
             return jsonify({'message': 'Admin access required'}), 403
         return fn(*args, **kwargs)
     
@@ -29,77 +36,78 @@ def admin_required(fn):
 
 @admin_bp.route('/dashboard', methods=['GET'])
 @admin_required
+@cache.cached(timeout=60, key_prefix=DASHBOARD_CACHE_KEY)
 def get_dashboard():
     """
     Get admin dashboard overview
     """
     today = datetime.utcnow().date()
+    today_start = datetime.combine(today, time.min)
+    tomorrow_start = today_start + timedelta(days=1)
     week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
-    
-    # Total complaints
-    total_complaints = Complaint.query.count()
-    
-    # Status breakdown
-    status_counts = db.session.query(
-        Complaint.status,
-        func.count(Complaint.id)
-    ).group_by(Complaint.status).all()
-    
-    # Category breakdown
-    category_counts = db.session.query(
-        Complaint.category,
-        func.count(Complaint.id)
-    ).group_by(Complaint.category).all()
-    
-    # Priority breakdown
-    priority_counts = db.session.query(
-        Complaint.priority,
-        func.count(Complaint.id)
-    ).group_by(Complaint.priority).all()
-    
-    # Today's complaints
-    today_complaints = Complaint.query.filter(
-        func.date(Complaint.created_at) == today
-    ).count()
-    
-    # This week's complaints
-    week_complaints = Complaint.query.filter(
-        Complaint.created_at >= week_ago
-    ).count()
-    
-    # Average resolution time (in hours)
-    avg_resolution = db.session.query(
-        func.avg(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-        )
-    ).filter(Complaint.resolved_at.isnot(None)).scalar() or 0
-    
-    # Critical issues count
-    critical_count = Complaint.query.filter(
-        Complaint.priority == 'critical',
-        Complaint.status.in_(['pending', 'in_progress'])
-    ).count()
-    
-    # Pending escalations
     escalation_threshold = datetime.utcnow() - timedelta(hours=48)
-    pending_escalations = Complaint.query.filter(
-        Complaint.status == 'pending',
-        Complaint.created_at < escalation_threshold
-    ).count()
+    
+    # All dashboard figures in a single pass over complaints: the grouping
+    # sets produce the status/category/priority breakdowns, and the () set
+    # yields one grand-total row carrying the filtered overview counts.
+    # GROUPING() tells the sets apart (a bit is set for each rolled-up column).
+    dashboard_query = text("""
+        SELECT
+            status,
+            category,
+            priority,
+            GROUPING(status, category, priority) AS grouping_id,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (
+                WHERE created_at >= :today_start AND created_at < :tomorrow_start
+            ) AS today,
+            COUNT(*) FILTER (WHERE created_at >= :week_ago) AS week,
+            COUNT(*) FILTER (
+                WHERE priority = 'critical' AND status IN ('pending', 'in_progress')
+            ) AS critical,
+            COUNT(*) FILTER (
+                WHERE status = 'pending' AND created_at < :escalation_threshold
+            ) AS escalations,
+            AVG(EXTRACT(epoch FROM resolved_at - created_at) / 3600)
+                FILTER (WHERE resolved_at IS NOT NULL) AS avg_resolution_hours
+        FROM complaints
+        GROUP BY GROUPING SETS ((status), (category), (priority), ())
+    """)
+    
+    rows = db.session.execute(dashboard_query, {
+        'today_start': today_start,
+        'tomorrow_start': tomorrow_start,
+        'week_ago': week_ago,
+        'escalation_threshold': escalation_threshold
+    }).fetchall()
+    
+    status_counts = {}
+    category_counts = {}
+    priority_counts = {}
+    overview = None
+    
+    for row in rows:
+        if row.grouping_id == 0b011:
+            status_counts[row.status] = row.total
+        elif row.grouping_id == 0b101:
+            category_counts[row.category] = row.total
+        elif row.grouping_id == 0b110:
+            priority_counts[row.priority] = row.total
+        else:
+            overview = row
     
     return jsonify({
         'overview': {
-            'total_complaints': total_complaints,
-            'today_complaints': today_complaints,
-            'week_complaints': week_complaints,
-            'critical_issues': critical_count,
-            'pending_escalations': pending_escalations,
-            'avg_resolution_hours': round(avg_resolution, 2)
+            'total_complaints': overview.total,
+            'today_complaints': overview.today,
+            'week_complaints': overview.week,
+            'critical_issues': overview.critical,
+            'pending_escalations': overview.escalations,
+            'avg_resolution_hours': round(float(overview.avg_resolution_hours or 0), 2)
         },
-        'status_breakdown': dict(status_counts),
-        'category_breakdown': dict(category_counts),
-        'priority_breakdown': dict(priority_counts)
+        'status_breakdown': status_counts,
+        'category_breakdown': category_counts,
+        'priority_breakdown': priority_counts
     }), 200
 
 
@@ -114,18 +122,21 @@ def get_users():
     role = request.args.get('role')
     search = request.args.get('search')
     
-    query = User.query
+    # Load just the serialized columns; raise rather than lazy-load relationships
+    query = User.query.options(
+        load_only(
+            User.id, User.email, User.first_name, User.last_name, User.phone,
+            User.role, User.department, User.is_active, User.created_at
+        ),
+        raiseload('*')
+    )
     
     if role:
         query = query.filter_by(role=role)
     
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (User.email.ilike(search_term)) |
-            (User.first_name.ilike(search_term)) |
-            (User.last_name.ilike(search_term))
-        )
+        search_term = f"%{search.lower()}%"
+        query = query.filter(User.search_text.like(search_term))
     
     query = query.order_by(User.created_at.desc())
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
@@ -154,14 +165,12 @@ def create_user():
     if data['role'] not in ['citizen', 'officer', 'admin']:
         return jsonify({'message': 'Invalid role'}), 400
     
-    if User.query.filter_by(email=data['email']).first():
+    if db.session.query(User.query.filter_by(email=data['email']).exists()).scalar():
         return jsonify({'message': 'Email already exists'}), 409
     
-    password_hash = bcrypt.generate_password_hash(data['password']).decode('utf-8')
-    
     user = User(
         email=data['email'],
-        password_hash=password_hash,
+        password_hash=hash_password(data['password']),
         first_name=data['first_name'],
         last_name=data['last_name'],
         phone=data.get('phone'),
@@ -170,7 +179,11 @@ def create_user():
     )
     
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Email already exists'}), 409
     
     return jsonify({'message': 'User created', 'user': user.to_dict()}), 201
 
@@ -202,6 +215,7 @@ def update_user(user_id):
         user.is_active = data['is_active']
     
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({'message': 'User updated', 'user': user.to_dict()}), 200
 
@@ -219,6 +233,7 @@ def deactivate_user(user_id):
     
     user.is_active = False
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({'message': 'User deactivated'}), 200
 
@@ -229,20 +244,22 @@ def get_officers():
     """
     Get all officers with their workload
     """
-    officers = User.query.filter_by(role='officer', is_active=True).all()
+    # One aggregate over the officer/complaint join instead of three
+    # COUNT queries per officer
+    officers = db.session.query(
+        User,
+        func.count(Complaint.id).label('assigned'),
+        func.count(Complaint.id).filter(Complaint.status == 'in_progress').label('pending'),
+        func.count(Complaint.id).filter(Complaint.status == 'resolved').label('resolved')
+    ).outerjoin(
+        Complaint, Complaint.officer_id == User.id
+    ).filter(
+        User.role == 'officer',
+        User.is_active == True
+    ).group_by(User.id).all()
     
     result = []
-    for officer in officers:
-        assigned_count = Complaint.query.filter_by(officer_id=officer.id).count()
-        pending_count = Complaint.query.filter_by(
-            officer_id=officer.id,
-            status='in_progress'
-        ).count()
-        resolved_count = Complaint.query.filter_by(
-            officer_id=officer.id,
-            status='resolved'
-        ).count()
-        
+    for officer, assigned_count, pending_count, resolved_count in officers:
         data = officer.to_dict()
         data['workload'] = {
             'assigned': assigned_count,
@@ -260,16 +277,18 @@ def get_departments():
     """
     Get all departments with stats
     """
-    departments = Department.query.filter_by(is_active=True).all()
+    departments = db.session.query(
+        Department,
+        func.count(Complaint.id).label('total'),
+        func.count(Complaint.id).filter(Complaint.status == 'pending').label('pending')
+    ).outerjoin(
+        Complaint, Complaint.department == Department.name
+    ).filter(
+        Department.is_active == True
+    ).group_by(Department.id).all()
     
     result = []
-    for dept in departments:
-        complaint_count = Complaint.query.filter_by(department=dept.name).count()
-        pending_count = Complaint.query.filter_by(
-            department=dept.name,
-            status='pending'
-        ).count()
-        
+    for dept, complaint_count, pending_count in departments:
         data = dept.to_dict()
         data['stats'] = {
             'total_complaints': complaint_count,
@@ -317,22 +336,27 @@ def get_heatmap_data():
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    query = Complaint.query.filter(Complaint.created_at >= start_date)
+    # Only the plotted columns, fetched in batches rather than as ORM objects
+    query = db.session.query(
+        Complaint.latitude,
+        Complaint.longitude,
+        Complaint.severity_score,
+        Complaint.category,
+        Complaint.status
+    ).filter(Complaint.created_at >= start_date)
     
     if category:
-        query = query.filter_by(category=category)
-    
-    complaints = query.all()
+        query = query.filter(Complaint.category == category)
     
     heatmap_data = [
         {
-            'lat': c.latitude,
-            'lng': c.longitude,
-            'intensity': c.severity_score,
-            'category': c.category,
-            'status': c.status
+            'lat': lat,
+            'lng': lng,
+            'intensity': severity,
+            'category': cat,
+            'status': status
         }
-        for c in complaints
+        for lat, lng, severity, cat, status in query.yield_per(1000)
     ]
     
     return jsonify({'heatmap': heatmap_data}), 200
@@ -355,15 +379,18 @@ def bulk_assign():
     if not officer:
         return jsonify({'message': 'Officer not found'}), 404
     
-    updated = 0
-    for cid in complaint_ids:
-        complaint = Complaint.query.filter_by(complaint_id=cid).first()
-        if complaint:
-            complaint.officer_id = officer_id
-            if complaint.status == 'pending':
-                complaint.status = 'in_progress'
-            updated += 1
+    # Single UPDATE for the whole batch; pending complaints move to in_progress
+    stmt = update(Complaint).where(
+        Complaint.complaint_id.in_(complaint_ids)
+    ).values(
+        officer_id=officer_id,
+        status=case((Complaint.status == 'pending', 'in_progress'), else_=Complaint.status)
+    ).execution_options(synchronize_session=False)
     
+    updated = db.session.execute(stmt).rowcount
     db.session.commit()
+    invalidate_dashboard()
+    invalidate_officer_dashboard(officer_id)
+    invalidate_track(*complaint_ids)
     
     return jsonify({'message': f'{updated} complaints assigned'}), 200
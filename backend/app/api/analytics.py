@@ -3,14 +3,67 @@ Analytics API Routes
 City-wide analytics, trends, and reporting
 """
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
-from sqlalchemy import func, text
-from app import db
-from app.models.models import Complaint, User
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_current_user
+from sqlalchemy import TIMESTAMP, Date, cast, func, select, text
+from sqlalchemy.orm import aliased
+from app import db, cache
+from app.models.models import Complaint, User, complaints_daily
+from app.utils.serialization import dumps_bytes
 
 analytics_bp = Blueprint('analytics', __name__)
 
+# Complaint columns included in /export rows
+# Export rows carry the same keys, in the same order, as Complaint.to_dict(),
+# with the reporter and officer nested between these two column groups
+EXPORT_COLUMNS = (
+    Complaint.id,
+    Complaint.complaint_id,
+    Complaint.title,
+    Complaint.description,
+    Complaint.category,
+    Complaint.ai_category,
+    Complaint.category_confidence,
+    Complaint.address,
+    Complaint.latitude,
+    Complaint.longitude,
+    Complaint.ward,
+    Complaint.zone,
+    Complaint.status,
+    Complaint.priority,
+    Complaint.severity_score,
+    Complaint.department
+)
+EXPORT_TRAILING_COLUMNS = (
+    Complaint.created_at,
+    Complaint.updated_at,
+    Complaint.resolved_at,
+    Complaint.escalation_level,
+    Complaint.is_duplicate
+)
+EXPORT_USER_FIELDS = (
+    'id', 'email', 'first_name', 'last_name', 'phone', 'role', 'department', 'is_active', 'created_at'
+)
+
+
+def _export_user(values):
+    """User.to_dict() from the exported user columns; None without a user"""
+    user = dict(zip(EXPORT_USER_FIELDS, values))
+    if user['id'] is None:
+        return None
+    return {
+        'id': user['id'],
+        'email': user['email'],
+        'first_name': user['first_name'],
+        'last_name': user['last_name'],
+        'full_name': f"{user['first_name']} {user['last_name']}",
+        'phone': user['phone'],
+        'role': user['role'],
+        'department': user['department'],
+        'is_active': user['is_active'],
+        'created_at': user['created_at']
+    }
+
 
 def auth_required(fn):
     """Decorator to require any authenticated user (officer or admin)"""
@@ -19,8 +72,8 @@ def auth_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        claims = get_jwt()
-        if claims.get('role') not in ['officer', 'admin']:
+        claims = get_current_user()
+        if claims['role'] not in ['officer', 'admin']:
             return jsonify({'message': 'Access denied'}), 403
         return fn(*args, **kwargs)
     
@@ -29,6 +82,7 @@ def auth_required(fn):
 
 @analytics_bp.route('/overview', methods=['GET'])
 @auth_required
+@cache.cached(timeout=60, query_string=True)
 def get_overview():
     """
     Get city-wide analytics overview
@@ -36,43 +90,36 @@ def get_overview():
     days = request.args.get('days', 30, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Total complaints in period
-    total = Complaint.query.filter(Complaint.created_at >= start_date).count()
+    # Period totals, resolutions, average resolution time and open
+    # complaints in one conditional aggregation
+    stats = db.session.query(
+        func.count().filter(Complaint.created_at >= start_date).label('total'),
+        func.count().filter(Complaint.resolved_at >= start_date).label('resolved'),
+        func.avg(
+            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
+        ).filter(Complaint.resolved_at >= start_date).label('avg_hours'),
+        func.count().filter(Complaint.status.in_(['pending', 'in_progress'])).label('pending')
+    ).one()._mapping
     
-    # Resolved in period
-    resolved = Complaint.query.filter(
-        Complaint.resolved_at >= start_date
-    ).count()
+    total = stats['total']
+    resolved = stats['resolved']
     
     # Resolution rate
     resolution_rate = (resolved / total * 100) if total > 0 else 0
     
-    # Average resolution time
-    avg_time = db.session.query(
-        func.avg(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-        )
-    ).filter(
-        Complaint.resolved_at >= start_date
-    ).scalar() or 0
-    
-    # Pending complaints
-    pending = Complaint.query.filter(
-        Complaint.status.in_(['pending', 'in_progress'])
-    ).count()
-    
     return jsonify({
         'period_days': days,
         'total_complaints': total,
         'resolved': resolved,
         'resolution_rate': round(resolution_rate, 2),
-        'avg_resolution_hours': round(avg_time, 2),
-        'pending': pending
+        'avg_resolution_hours': round(stats['avg_hours'] or 0, 2),
+        'pending': stats['pending']
     }), 200
 
 
 @analytics_bp.route('/trends', methods=['GET'])
 @auth_required
+@cache.cached(timeout=60, query_string=True)
 def get_trends():
     """
     Get complaint trends over time
@@ -82,36 +129,40 @@ def get_trends():
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    daily = complaints_daily.c
+    
+    # date_trunc on a date yields timestamptz; truncate a timestamp and cast
+    # back so every granularity reports plain ISO dates
     if granularity == 'day':
-        date_trunc = func.date(Complaint.created_at)
+        date_trunc = daily.day
     elif granularity == 'week':
-        date_trunc = func.date_trunc('week', Complaint.created_at)
+        date_trunc = cast(func.date_trunc('week', cast(daily.day, TIMESTAMP)), Date)
     else:
-        date_trunc = func.date_trunc('month', Complaint.created_at)
+        date_trunc = cast(func.date_trunc('month', cast(daily.day, TIMESTAMP)), Date)
     
-    # Complaints over time
+    # Complaints over time, rolled up from the daily aggregate
     trends = db.session.query(
         date_trunc.label('period'),
-        func.count(Complaint.id).label('count')
+        func.sum(daily.total).label('count')
     ).filter(
-        Complaint.created_at >= start_date
-    ).group_by(date_trunc).order_by(date_trunc).all()
+        daily.day >= start_date.date()
+    ).group_by('period').order_by('period').all()
     
     # Resolutions over time
     resolution_trends = db.session.query(
-        func.date(Complaint.resolved_at).label('period'),
+        func.date_trunc('day', Complaint.resolved_at).label('period'),
         func.count(Complaint.id).label('count')
     ).filter(
         Complaint.resolved_at >= start_date
-    ).group_by(func.date(Complaint.resolved_at)).order_by(func.date(Complaint.resolved_at)).all()
+    ).group_by('period').order_by('period').all()
     
     return jsonify({
         'complaints_trend': [
-            {'period': str(t.period), 'count': t.count}
+            {'period': t.period.isoformat(), 'count': t.count}
             for t in trends
         ],
         'resolutions_trend': [
-            {'period': str(t.period), 'count': t.count}
+            {'period': str(t.period.date()), 'count': t.count}
             for t in resolution_trends
         ]
     }), 200
@@ -119,6 +170,7 @@ def get_trends():
 
 @analytics_bp.route('/categories', methods=['GET'])
 @auth_required
+@cache.cached(timeout=60, query_string=True)
 def get_category_analytics():
     """
     Get analytics by category
@@ -126,17 +178,19 @@ def get_category_analytics():
     days = request.args.get('days', 30, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    daily = complaints_daily.c
+    
     # Count by category
     category_counts = db.session.query(
-        Complaint.category,
-        func.count(Complaint.id).label('total'),
-        func.count(Complaint.id).filter(Complaint.status == 'resolved').label('resolved'),
-        func.avg(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
+        daily.category,
+        func.sum(daily.total).label('total'),
+        func.sum(daily.resolved).label('resolved'),
+        (
+            func.sum(daily.resolution_hours_sum) / func.nullif(func.sum(daily.resolution_count), 0)
         ).label('avg_resolution_hours')
     ).filter(
-        Complaint.created_at >= start_date
-    ).group_by(Complaint.category).all()
+        daily.day >= start_date.date()
+    ).group_by(daily.category).all()
     
     result = []
     for cat in category_counts:
@@ -146,7 +200,7 @@ def get_category_analytics():
             'resolved': cat.resolved or 0,
             'pending': cat.total - (cat.resolved or 0),
             'resolution_rate': round((cat.resolved or 0) / cat.total * 100, 2) if cat.total > 0 else 0,
-            'avg_resolution_hours': round(cat.avg_resolution_hours or 0, 2)
+            'avg_resolution_hours': round(float(cat.avg_resolution_hours or 0), 2)
         })
     
     return jsonify({'categories': result}), 200
@@ -161,16 +215,20 @@ def get_zone_analytics():
     days = request.args.get('days', 30, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    daily = complaints_daily.c
+    
     # Top problematic zones
     zone_stats = db.session.query(
-        Complaint.zone,
-        func.count(Complaint.id).label('total'),
-        func.count(Complaint.id).filter(Complaint.status == 'resolved').label('resolved'),
-        func.avg(Complaint.severity_score).label('avg_severity')
+        daily.zone,
+        func.sum(daily.total).label('total'),
+        func.sum(daily.resolved).label('resolved'),
+        (
+            func.sum(daily.severity_sum) / func.nullif(func.sum(daily.severity_count), 0)
+        ).label('avg_severity')
     ).filter(
-        Complaint.created_at >= start_date,
-        Complaint.zone.isnot(None)
-    ).group_by(Complaint.zone).order_by(func.count(Complaint.id).desc()).limit(20).all()
+        daily.day >= start_date.date(),
+        daily.zone.isnot(None)
+    ).group_by(daily.zone).order_by(func.sum(daily.total).desc()).limit(20).all()
     
     result = []
     for zone in zone_stats:
@@ -194,18 +252,20 @@ def get_department_analytics():
     days = request.args.get('days', 30, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    daily = complaints_daily.c
+    
     dept_stats = db.session.query(
-        Complaint.department,
-        func.count(Complaint.id).label('total'),
-        func.count(Complaint.id).filter(Complaint.status == 'resolved').label('resolved'),
-        func.count(Complaint.id).filter(Complaint.status == 'pending').label('pending'),
-        func.avg(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
+        daily.department,
+        func.sum(daily.total).label('total'),
+        func.sum(daily.resolved).label('resolved'),
+        func.sum(daily.pending).label('pending'),
+        (
+            func.sum(daily.resolution_hours_sum) / func.nullif(func.sum(daily.resolution_count), 0)
         ).label('avg_resolution_hours')
     ).filter(
-        Complaint.created_at >= start_date,
-        Complaint.department.isnot(None)
-    ).group_by(Complaint.department).all()
+        daily.day >= start_date.date(),
+        daily.department.isnot(None)
+    ).group_by(daily.department).all()
     
     result = []
     for dept in dept_stats:
@@ -216,7 +276,7 @@ def get_department_analytics():
             'pending': dept.pending or 0,
             'in_progress': dept.total - (dept.resolved or 0) - (dept.pending or 0),
             'resolution_rate': round((dept.resolved or 0) / dept.total * 100, 2) if dept.total > 0 else 0,
-            'avg_resolution_hours': round(dept.avg_resolution_hours or 0, 2)
+            'avg_resolution_hours': round(float(dept.avg_resolution_hours or 0), 2)
         })
     
     return jsonify({'departments': result}), 200
@@ -232,47 +292,40 @@ def get_hotspots():
     category = request.args.get('category')
     
     start_date = datetime.utcnow() - timedelta(days=days)
+    grid_size = 0.01  # Approximately 1km
     
-    query = Complaint.query.filter(Complaint.created_at >= start_date)
+    # Grid-based clustering done server-side: bucket coordinates onto the
+    # grid and aggregate per cell, returning only the top 50 cells
+    grid_lat = (func.round(Complaint.latitude / grid_size) * grid_size).label('lat')
+    grid_lng = (func.round(Complaint.longitude / grid_size) * grid_size).label('lng')
     
-    if category:
-        query = query.filter_by(category=category)
+    query = db.session.query(
+        grid_lat,
+        grid_lng,
+        func.count(Complaint.id).label('count'),
+        func.avg(Complaint.severity_score).label('avg_severity'),
+        func.mode().within_group(Complaint.category).label('top_category')
+    ).filter(Complaint.created_at >= start_date)
     
-    complaints = query.all()
-    
-    # Simple grid-based clustering
-    clusters = {}
-    grid_size = 0.01  # Approximately 1km
+    if category:
+        query = query.filter(Complaint.category == category)
     
-    for c in complaints:
-        grid_lat = round(c.latitude / grid_size) * grid_size
-        grid_lng = round(c.longitude / grid_size) * grid_size
-        key = f"{grid_lat},{grid_lng}"
-        
-        if key not in clusters:
-            clusters[key] = {
-                'lat': grid_lat,
-                'lng': grid_lng,
-                'count': 0,
-                'avg_severity': 0,
-                'categories': {}
-            }
-        
-        clusters[key]['count'] += 1
-        clusters[key]['avg_severity'] += c.severity_score
-        clusters[key]['categories'][c.category] = clusters[key]['categories'].get(c.category, 0) + 1
-    
-    # Finalize averages and sort by count
-    hotspots = []
-    for key, cluster in clusters.items():
-        cluster['avg_severity'] = round(cluster['avg_severity'] / cluster['count'], 2)
-        cluster['top_category'] = max(cluster['categories'], key=cluster['categories'].get) if cluster['categories'] else None
-        del cluster['categories']
-        hotspots.append(cluster)
-    
-    hotspots.sort(key=lambda x: x['count'], reverse=True)
-    
-    return jsonify({'hotspots': hotspots[:50]}), 200
+    clusters = query.group_by('lat', 'lng').order_by(
+        func.count(Complaint.id).desc()
+    ).limit(50).all()
+    
+    hotspots = [
+        {
+            'lat': float(c.lat),
+            'lng': float(c.lng),
+            'count': c.count,
+            'avg_severity': round(c.avg_severity or 0, 2),
+            'top_category': c.top_category
+        }
+        for c in clusters
+    ]
+    
+    return jsonify({'hotspots': hotspots}), 200
 
 
 @analytics_bp.route('/resolution-times', methods=['GET'])
@@ -284,18 +337,14 @@ def get_resolution_times():
     days = request.args.get('days', 90, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Resolution time by priority
+    # Resolution time by priority. The aggregates run over the raw interval
+    # and are converted to hours once per group rather than once per row.
+    resolution_time = Complaint.resolved_at - Complaint.created_at
     priority_times = db.session.query(
         Complaint.priority,
-        func.avg(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-        ).label('avg_hours'),
-        func.min(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-        ).label('min_hours'),
-        func.max(
-            func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-        ).label('max_hours')
+        (func.extract('epoch', func.avg(resolution_time)) / 3600).label('avg_hours'),
+        (func.extract('epoch', func.min(resolution_time)) / 3600).label('min_hours'),
+        (func.extract('epoch', func.max(resolution_time)) / 3600).label('max_hours')
     ).filter(
         Complaint.resolved_at >= start_date
     ).group_by(Complaint.priority).all()
@@ -368,16 +417,46 @@ def export_data():
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    query = Complaint.query.filter(Complaint.created_at >= start_date)
+    # Column export via a Core select: rows come back as tuples and never
+    # pass through the ORM identity map or Complaint.to_dict()
+    reporter = aliased(User)
+    officer = aliased(User)
+    stmt = select(
+        *EXPORT_COLUMNS,
+        *(getattr(reporter, field) for field in EXPORT_USER_FIELDS),
+        *(getattr(officer, field) for field in EXPORT_USER_FIELDS),
+        *EXPORT_TRAILING_COLUMNS
+    ).outerjoin(
+        reporter, reporter.id == Complaint.user_id
+    ).outerjoin(
+        officer, officer.id == Complaint.officer_id
+    ).where(Complaint.created_at >= start_date)
     
     if category:
-        query = query.filter_by(category=category)
+        stmt = stmt.where(Complaint.category == category)
     if status:
-        query = query.filter_by(status=status)
-    
-    complaints = query.limit(1000).all()
-    
-    return jsonify({
-        'count': len(complaints),
-        'data': [c.to_dict() for c in complaints]
-    }), 200
+        stmt = stmt.where(Complaint.status == status)
+    
+    stmt = stmt.limit(1000).execution_options(yield_per=200)
+    keys = tuple(column.key for column in EXPORT_COLUMNS)
+    trailing_keys = tuple(column.key for column in EXPORT_TRAILING_COLUMNS)
+    reporter_end = len(keys) + len(EXPORT_USER_FIELDS)
+    officer_end = reporter_end + len(EXPORT_USER_FIELDS)
+    
+    def generate():
+        # Rows are encoded and sent as they are fetched, so the full export
+        # is never held in memory; count trails the data for that reason
+        count = 0
+        yield b'{"data":['
+        for row in db.session.execute(stmt):
+            record = dict(zip(keys, row))
+            record['reporter'] = _export_user(row[len(keys):reporter_end])
+            record['officer'] = _export_user(row[reporter_end:officer_end])
+            record.update(zip(trailing_keys, row[officer_end:]))
+            if count:
+                yield b','
+            yield dumps_bytes(record)
+            count += 1
+        yield b'],"count":' + str(count).encode() + b'}'
+    
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
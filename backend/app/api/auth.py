@@ -7,9 +7,12 @@ from flask_jwt_extended import (
     create_access_token, create_refresh_token,
     jwt_required, get_jwt_identity, get_jwt
 )
+from sqlalchemy.exc import IntegrityError
 from marshmallow import Schema, fields, validate, ValidationError
-from app import db, bcrypt
+from app import db
 from app.models.models import User
+from app.utils.cache import get_user_cached, invalidate_user, revoke_token
+from app.utils.security import check_password, forget_password_hash, hash_password, needs_rehash
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -28,8 +31,9 @@ class LoginSchema(Schema):
     password = fields.Str(required=True)
 
 
-# Revoked tokens storage (in production, use Redis)
-revoked_tokens = set()
+# Schemas are stateless on load(), so build them once per process
+register_schema = RegisterSchema()
+login_schema = LoginSchema()
 
 
 @auth_bp.route('/register', methods=['POST'])
@@ -38,16 +42,12 @@ def register():
     Register a new user (citizen by default)
     """
     try:
-        data = RegisterSchema().load(request.get_json())
+        data = register_schema.load(request.get_json())
     except ValidationError as err:
         return jsonify({'message': 'Validation error', 'errors': err.messages}), 400
     
-    # Check if user already exists
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'message': 'Email already registered'}), 409
-    
     # Create new user
-    password_hash = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    password_hash = hash_password(data['password'])
     
     user = User(
         email=data['email'],
@@ -58,8 +58,13 @@ def register():
         role='citizen'
     )
     
+    # The unique index on email rejects duplicates, including concurrent ones
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Email already registered'}), 409
     
     # Generate tokens
     access_token = create_access_token(
@@ -82,18 +87,24 @@ def login():
     Login user and return tokens
     """
     try:
-        data = LoginSchema().load(request.get_json())
+        data = login_schema.load(request.get_json())
     except ValidationError as err:
         return jsonify({'message': 'Validation error', 'errors': err.messages}), 400
     
     user = User.query.filter_by(email=data['email']).first()
     
-    if not user or not bcrypt.check_password_hash(user.password_hash, data['password']):
+    if not user or not check_password(user.password_hash, data['password']):
         return jsonify({'message': 'Invalid email or password'}), 401
     
     if not user.is_active:
         return jsonify({'message': 'Account is deactivated'}), 403
     
+    # Upgrade legacy bcrypt hashes now that we know the plaintext
+    if needs_rehash(user.password_hash):
+        forget_password_hash(user.password_hash)
+        user.password_hash = hash_password(data['password'])
+        db.session.commit()
+    
     # Generate tokens
     access_token = create_access_token(
         identity=str(user.id),
@@ -116,14 +127,14 @@ def refresh():
     Refresh access token using refresh token
     """
     current_user_id = get_jwt_identity()
-    user = User.query.get(int(current_user_id))
+    user = get_user_cached(int(current_user_id))
     
-    if not user or not user.is_active:
+    if not user or not user['is_active']:
         return jsonify({'message': 'User not found or inactive'}), 404
     
     access_token = create_access_token(
-        identity=str(user.id),
-        additional_claims={'role': user.role, 'email': user.email}
+        identity=str(user['id']),
+        additional_claims={'role': user['role'], 'email': user['email']}
     )
     
     return jsonify({'access_token': access_token}), 200
@@ -135,8 +146,8 @@ def logout():
     """
     Logout user and revoke token
     """
-    jti = get_jwt()['jti']
-    revoked_tokens.add(jti)
+    claims = get_jwt()
+    revoke_token(claims['jti'], claims['exp'])
     return jsonify({'message': 'Logout successful'}), 200
 
 
@@ -147,12 +158,12 @@ def get_current_user():
     Get current authenticated user
     """
     current_user_id = get_jwt_identity()
-    user = User.query.get(int(current_user_id))
+    user = get_user_cached(int(current_user_id))
     
     if not user:
         return jsonify({'message': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()}), 200
+    return jsonify({'user': user}), 200
 
 
 @auth_bp.route('/me', methods=['PUT'])
@@ -177,6 +188,7 @@ def update_profile():
         user.phone = data['phone']
     
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({'message': 'Profile updated', 'user': user.to_dict()}), 200
 
@@ -195,13 +207,14 @@ def change_password():
     
     data = request.get_json()
     
-    if not bcrypt.check_password_hash(user.password_hash, data.get('current_password', '')):
+    if not check_password(user.password_hash, data.get('current_password', '')):
         return jsonify({'message': 'Current password is incorrect'}), 400
     
     if len(data.get('new_password', '')) < 8:
         return jsonify({'message': 'New password must be at least 8 characters'}), 400
     
-    user.password_hash = bcrypt.generate_password_hash(data['new_password']).decode('utf-8')
+    forget_password_hash(user.password_hash)
+    user.password_hash = hash_password(data['new_password'])
     db.session.commit()
     
     return jsonify({'message': 'Password changed successfully'}), 200
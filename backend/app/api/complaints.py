@@ -4,16 +4,23 @@ Handles complaint submission, tracking, and updates
 """
 import os
 import uuid
-from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
 from werkzeug.utils import secure_filename
-from marshmallow import Schema, fields, validate, ValidationError
-from sqlalchemy import func, text
-from app import db
+from marshmallow import INCLUDE, Schema, fields, validate, ValidationError
+from geoalchemy2 import Geography
+from sqlalchemy import cast, func
+from sqlalchemy.orm import joinedload, selectinload
+from app import db, cache
 from app.models.models import Complaint, StatusUpdate, User
 from app.services.ai_service import AIService
-from app.services.complaint_service import ComplaintService
+from app.services.complaint_service import CATEGORY_DEPARTMENT_MAP, DEFAULT_DEPARTMENT, ComplaintService
+from app.utils.background import run_in_background
+from app.utils.cache import (
+    TRACK_CACHE_TIMEOUT, invalidate_dashboard, invalidate_officer_dashboard,
+    invalidate_track, track_cache_key
+)
+from app.utils.pagination import paginate_complaints
 
 complaints_bp = Blueprint('complaints', __name__)
 ai_service = AIService()
@@ -35,19 +42,12 @@ class ComplaintSchema(Schema):
     zone = fields.Str(validate=validate.Length(max=100))
 
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+complaint_schema = ComplaintSchema(unknown=INCLUDE)
 
 
-def generate_complaint_id():
-    """Generate unique complaint ID: CL-YYYY-XXXXXX"""
-    year = datetime.utcnow().year
-    count = Complaint.query.filter(
-        func.extract('year', Complaint.created_at) == year
-    ).count() + 1
-    return f"CL-{year}-{count:06d}"
+def allowed_file(filename):
+    """Check if file extension is allowed"""
+    return current_app.config['ALLOWED_FILENAME_RE'].search(filename) is not None
 
 
 @complaints_bp.route('', methods=['POST'])
@@ -59,9 +59,8 @@ def create_complaint():
     current_user_id = int(get_jwt_identity())
     
     # Validate JSON data
-    from marshmallow import INCLUDE
     try:
-        data = ComplaintSchema().load(request.form.to_dict(), unknown=INCLUDE)
+        data = complaint_schema.load(request.form.to_dict())
     except ValidationError as err:
         print(f"Validation Error: {err.messages}")
         return jsonify({'message': 'Validation error', 'errors': err.messages}), 400
@@ -73,50 +72,42 @@ def create_complaint():
         if file and file.filename and allowed_file(file.filename):
             filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            file.save(filepath, buffer_size=current_app.config['UPLOAD_BUFFER_SIZE'])
             image_url = f"/uploads/{filename}"
     
-    # AI processing - categorize and calculate severity
-    ai_result = ai_service.process_complaint(
-        text=data['description'],
-        category=data.get('category'),
-        latitude=data['latitude'],
-        longitude=data['longitude']
-    )
-    
-    # Create complaint
+    # Create complaint; AI categorization and severity are filled in by a
+    # background job, so the citizen's category (or 'other') stands in until then
+    # and ai_category stays NULL until it has run.
+    # complaint_id is assigned by the database default in the same INSERT
+    category = data.get('category') or 'other'
     complaint = Complaint(
-        complaint_id=generate_complaint_id(),
         user_id=current_user_id,
         title=data['title'],
         description=data['description'],
-        category=data.get('category') or ai_result['category'],
-        ai_category=ai_result['category'],
-        category_confidence=ai_result['confidence'],
+        category=category,
         latitude=data['latitude'],
         longitude=data['longitude'],
-        location=f"POINT({data['longitude']} {data['latitude']})",
+        location=func.ST_SetSRID(func.ST_MakePoint(data['longitude'], data['latitude']), 4326),
         address=data.get('address'),
         ward=data.get('ward'),
         zone=data.get('zone'),
         image_url=image_url,
-        severity_score=ai_result['severity_score'],
-        priority=ai_result['priority'],
-        department=complaint_service.get_department_for_category(ai_result['category'])
+        department=CATEGORY_DEPARTMENT_MAP.get(category, DEFAULT_DEPARTMENT)
     )
     
+    # The initial 'Complaint submitted' status update is inserted by the
+    # trg_complaints_seed_status trigger
     db.session.add(complaint)
+    db.session.commit()
+    invalidate_dashboard()
     
-    # Create initial status update
-    status_update = StatusUpdate(
-        complaint=complaint,
-        user_id=current_user_id,
-        new_status='pending',
-        comment='Complaint submitted'
+    run_in_background(
+        _classify_complaint, complaint.id, complaint.complaint_id,
+        text=data['description'],
+        category=data.get('category'),
+        latitude=data['latitude'],
+        longitude=data['longitude']
     )
-    db.session.add(status_update)
-    
-    db.session.commit()
     
     return jsonify({
         'message': 'Complaint submitted successfully',
@@ -124,6 +115,24 @@ def create_complaint():
     }), 201
 
 
+def _classify_complaint(complaint_pk, complaint_id, **fields):
+    """Run AI processing and store its results (runs in the background pool)"""
+    try:
+        ai_result = ai_service.process_complaint(complaint_pk=complaint_pk, **fields)
+        complaint_service.apply_classification(complaint_pk, ai_result)
+        db.session.commit()
+    except Exception:
+        # ai_category stays NULL, so `flask rescore-complaints` picks it up
+        current_app.logger.exception('Classification of complaint %s failed', complaint_id)
+        db.session.rollback()
+        return
+    finally:
+        db.session.remove()
+    
+    invalidate_dashboard()
+    invalidate_track(complaint_id)
+
+
 @complaints_bp.route('', methods=['GET'])
 @jwt_required()
 def get_complaints():
@@ -131,8 +140,8 @@ def get_complaints():
     Get complaints for current user or all (for admin/officer)
     """
     current_user_id = int(get_jwt_identity())
-    claims = get_jwt()
-    role = claims.get('role', 'citizen')
+    claims = get_current_user()
+    role = claims['role']
     
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
@@ -140,15 +149,14 @@ def get_complaints():
     category = request.args.get('category')
     priority = request.args.get('priority')
     
-    query = Complaint.query
+    query = Complaint.query_with_people()
     
     # Role-based filtering
     if role == 'citizen':
         query = query.filter_by(user_id=current_user_id)
     elif role == 'officer':
-        user = User.query.get(current_user_id)
-        if user and user.department:
-            query = query.filter_by(department=user.department)
+        if claims['department']:
+            query = query.filter_by(department=claims['department'])
     
     # Apply filters
     if status:
@@ -159,20 +167,13 @@ def get_complaints():
         query = query.filter_by(priority=priority)
     
     # Order by priority and creation date
-    query = query.order_by(
-        Complaint.severity_score.desc(),
-        Complaint.created_at.desc()
-    )
-    
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        result = paginate_complaints(query, page, per_page, after=request.args.get('after'))
+    except ValueError as err:
+        return jsonify({'message': str(err)}), 400
     
-    return jsonify({
-        'complaints': [c.to_dict() for c in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page,
-        'per_page': per_page
-    }), 200
+    result['per_page'] = per_page
+    return jsonify(result), 200
 
 
 @complaints_bp.route('/<string:complaint_id>', methods=['GET'])
@@ -182,10 +183,14 @@ def get_complaint(complaint_id):
     Get a single complaint by ID
     """
     current_user_id = int(get_jwt_identity())
-    claims = get_jwt()
-    role = claims.get('role', 'citizen')
+    claims = get_current_user()
+    role = claims['role']
     
-    complaint = Complaint.query.filter_by(complaint_id=complaint_id).first()
+    complaint = Complaint.query.options(
+        joinedload(Complaint.reporter),
+        joinedload(Complaint.assigned_officer),
+        selectinload(Complaint.status_updates).joinedload(StatusUpdate.updated_by_user)
+    ).filter_by(complaint_id=complaint_id).first()
     
     if not complaint:
         return jsonify({'message': 'Complaint not found'}), 404
@@ -204,8 +209,8 @@ def update_complaint_status(complaint_id):
     Update complaint status (officers/admin only)
     """
     current_user_id = int(get_jwt_identity())
-    claims = get_jwt()
-    role = claims.get('role', 'citizen')
+    claims = get_current_user()
+    role = claims['role']
     
     if role == 'citizen':
         return jsonify({'message': 'Access denied'}), 403
@@ -223,22 +228,13 @@ def update_complaint_status(complaint_id):
     if new_status not in valid_statuses:
         return jsonify({'message': f'Invalid status. Must be one of: {valid_statuses}'}), 400
     
-    # Create status update
-    status_update = StatusUpdate(
-        complaint=complaint,
-        user_id=current_user_id,
-        previous_status=complaint.status,
-        new_status=new_status,
-        comment=comment
+    complaint_service.record_status_change(
+        complaint.id, current_user_id, complaint.status, new_status, comment
     )
-    
-    # Update complaint
-    complaint.status = new_status
-    if new_status == 'resolved':
-        complaint.resolved_at = datetime.utcnow()
-    
-    db.session.add(status_update)
     db.session.commit()
+    invalidate_dashboard()
+    invalidate_officer_dashboard(complaint.officer_id)
+    invalidate_track(complaint_id)
     
     return jsonify({
         'message': 'Status updated',
@@ -252,8 +248,8 @@ def assign_complaint(complaint_id):
     """
     Assign complaint to an officer (admin only)
     """
-    claims = get_jwt()
-    role = claims.get('role', 'citizen')
+    claims = get_current_user()
+    role = claims['role']
     
     if role != 'admin':
         return jsonify({'message': 'Admin access required'}), 403
@@ -270,11 +266,15 @@ def assign_complaint(complaint_id):
     if not officer:
         return jsonify({'message': 'Officer not found'}), 404
     
+    previous_officer_id = complaint.officer_id
     complaint.officer_id = officer_id
     if complaint.status == 'pending':
         complaint.status = 'in_progress'
     
     db.session.commit()
+    invalidate_dashboard()
+    invalidate_officer_dashboard(previous_officer_id, officer_id)
+    invalidate_track(complaint_id)
     
     return jsonify({
         'message': 'Complaint assigned',
@@ -295,28 +295,22 @@ def get_nearby_complaints():
     if lat is None or lng is None:
         return jsonify({'message': 'Latitude and longitude required'}), 400
     
-    # PostGIS distance query
-    point = f"POINT({lng} {lat})"
-    distance_query = text("""
-        SELECT *, ST_Distance(location::geography, ST_GeomFromText(:point, 4326)::geography) / 1000 as distance_km
-        FROM complaints
-        WHERE ST_DWithin(location::geography, ST_GeomFromText(:point, 4326)::geography, :radius)
-        ORDER BY distance_km
-        LIMIT 50
-    """)
-    
-    results = db.session.execute(
-        distance_query,
-        {'point': point, 'radius': radius_km * 1000}
-    ).fetchall()
+    # PostGIS distance query, loading complaints and their people in one go
+    origin = cast(func.ST_SetSRID(func.ST_MakePoint(lng, lat), 4326), Geography)
+    distance_km = (func.ST_Distance(Complaint.location, origin) / 1000).label('distance_km')
+    
+    results = db.session.query(Complaint, distance_km).options(
+        joinedload(Complaint.reporter),
+        joinedload(Complaint.assigned_officer)
+    ).filter(
+        func.ST_DWithin(Complaint.location, origin, radius_km * 1000)
+    ).order_by(distance_km).limit(50).all()
     
     complaints = []
-    for row in results:
-        complaint = Complaint.query.get(row.id)
-        if complaint:
-            data = complaint.to_dict()
-            data['distance_km'] = round(row.distance_km, 2)
-            complaints.append(data)
+    for complaint, distance in results:
+        data = complaint.to_dict()
+        data['distance_km'] = round(distance, 2)
+        complaints.append(data)
     
     return jsonify({'complaints': complaints}), 200
 
@@ -326,25 +320,35 @@ def track_complaint(complaint_id):
     """
     Public endpoint to track complaint status (no auth required)
     """
-    complaint = Complaint.query.filter_by(complaint_id=complaint_id).first()
+    cache_key = track_cache_key(complaint_id)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+    
+    complaint = Complaint.query.options(
+        selectinload(Complaint.status_updates)
+    ).filter_by(complaint_id=complaint_id).first()
     
     if not complaint:
         return jsonify({'message': 'Complaint not found'}), 404
     
-    return jsonify({
+    result = {
         'complaint_id': complaint.complaint_id,
         'title': complaint.title,
         'category': complaint.category,
         'status': complaint.status,
         'priority': complaint.priority,
-        'created_at': complaint.created_at.isoformat(),
-        'resolved_at': complaint.resolved_at.isoformat() if complaint.resolved_at else None,
+        'created_at': complaint.created_at,
+        'resolved_at': complaint.resolved_at,
         'status_updates': [
             {
                 'status': u.new_status,
                 'comment': u.comment,
-                'date': u.created_at.isoformat()
+                'date': u.created_at
             }
-            for u in complaint.status_updates.order_by(StatusUpdate.created_at.asc()).all()
+            for u in reversed(complaint.status_updates)
         ]
-    }), 200
+    }
+    cache.set(cache_key, result, timeout=TRACK_CACHE_TIMEOUT)
+    
+    return jsonify(result), 200
@@ -2,14 +2,21 @@
 Officer API Routes
 Endpoints for field officers to manage assigned complaints
 """
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from sqlalchemy import func
-from app import db
-from app.models.models import Complaint, User, StatusUpdate
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, get_current_user
+from sqlalchemy import func, text
+from app import db, cache
+from app.models.models import Complaint, StatusUpdate
+from app.services.complaint_service import ComplaintService
+from app.utils.cache import (
+    OFFICER_DASHBOARD_TIMEOUT, get_user_cached, invalidate_dashboard, invalidate_officer_dashboard,
+    invalidate_track, officer_dashboard_key, officer_performance_key
+)
+from app.utils.pagination import paginate_complaints
 
 officer_bp = Blueprint('officer', __name__)
+complaint_service = ComplaintService()
 
 
 def officer_required(fn):
@@ -19,8 +26,8 @@ def officer_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        claims = get_jwt()
-        if claims.get('role') not in ['officer', 'admin']:
+        claims = get_current_user()
+        if claims['role'] not in ['officer', 'admin']:
             return jsonify({'message': 'Officer access required'}), 403
         return fn(*args, **kwargs)
     
@@ -34,49 +41,50 @@ def get_officer_dashboard():
     Get officer's personal dashboard
     """
     current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
-    
-    # My assigned complaints
-    my_complaints = Complaint.query.filter_by(officer_id=current_user_id)
-    
-    total_assigned = my_complaints.count()
-    pending = my_complaints.filter_by(status='in_progress').count()
-    resolved_today = my_complaints.filter(
-        Complaint.status == 'resolved',
-        func.date(Complaint.resolved_at) == datetime.utcnow().date()
-    ).count()
-    resolved_this_week = my_complaints.filter(
-        Complaint.status == 'resolved',
-        Complaint.resolved_at >= datetime.utcnow() - timedelta(days=7)
-    ).count()
-    
-    # Critical issues
-    critical = my_complaints.filter(
-        Complaint.priority == 'critical',
-        Complaint.status != 'resolved'
-    ).count()
-    
-    # Average resolution time (in hours)
-    avg_resolution = db.session.query(
+    
+    cache_key = officer_dashboard_key(current_user_id)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+    
+    user = get_user_cached(current_user_id)
+    
+    today_start = datetime.combine(datetime.utcnow().date(), time.min)
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    is_resolved = Complaint.status == 'resolved'
+    
+    # All stats for my assigned complaints in one conditional aggregation
+    stats = db.session.query(
+        func.count(Complaint.id).label('total_assigned'),
+        func.count(Complaint.id).filter(Complaint.status == 'in_progress').label('pending'),
+        func.count(Complaint.id).filter(
+            is_resolved, Complaint.resolved_at >= today_start
+        ).label('resolved_today'),
+        func.count(Complaint.id).filter(
+            is_resolved, Complaint.resolved_at >= week_ago
+        ).label('resolved_this_week'),
+        func.count(Complaint.id).filter(
+            Complaint.priority == 'critical', Complaint.status != 'resolved'
+        ).label('critical'),
         func.avg(
             func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-        )
-    ).filter(
-        Complaint.officer_id == current_user_id,
-        Complaint.resolved_at.isnot(None)
-    ).scalar() or 0
+        ).filter(Complaint.resolved_at.isnot(None)).label('avg_resolution')
+    ).filter(Complaint.officer_id == current_user_id).one()
     
-    return jsonify({
-        'officer': user.to_dict() if user else None,
+    result = {
+        'officer': user,
         'stats': {
-            'total_assigned': total_assigned,
-            'pending': pending,
-            'resolved_today': resolved_today,
-            'resolved_this_week': resolved_this_week,
-            'critical_issues': critical,
-            'avg_resolution_hours': round(avg_resolution, 2)
+            'total_assigned': stats.total_assigned,
+            'pending': stats.pending,
+            'resolved_today': stats.resolved_today,
+            'resolved_this_week': stats.resolved_this_week,
+            'critical_issues': stats.critical,
+            'avg_resolution_hours': round(float(stats.avg_resolution or 0), 2)
         }
-    }), 200
+    }
+    cache.set(cache_key, result, timeout=OFFICER_DASHBOARD_TIMEOUT)
+    
+    return jsonify(result), 200
 
 
 @officer_bp.route('/complaints', methods=['GET'])
@@ -92,7 +100,7 @@ def get_my_complaints():
     status = request.args.get('status')
     priority = request.args.get('priority')
     
-    query = Complaint.query.filter_by(officer_id=current_user_id)
+    query = Complaint.query_with_people().filter_by(officer_id=current_user_id)
     
     if status:
         query = query.filter_by(status=status)
@@ -100,19 +108,12 @@ def get_my_complaints():
         query = query.filter_by(priority=priority)
     
     # Sort by priority (critical first) and date
-    query = query.order_by(
-        Complaint.severity_score.desc(),
-        Complaint.created_at.desc()
-    )
-    
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        result = paginate_complaints(query, page, per_page, after=request.args.get('after'))
+    except ValueError as err:
+        return jsonify({'message': str(err)}), 400
     
-    return jsonify({
-        'complaints': [c.to_dict() for c in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page
-    }), 200
+    return jsonify(result), 200
 
 
 @officer_bp.route('/complaints/<string:complaint_id>/update', methods=['POST'])
@@ -142,23 +143,15 @@ def update_my_complaint(complaint_id):
     if new_status and new_status not in valid_statuses:
         return jsonify({'message': f'Invalid status. Officers can set: {valid_statuses}'}), 400
     
-    # Create status update
     if new_status:
-        status_update = StatusUpdate(
-            complaint=complaint,
-            user_id=current_user_id,
-            previous_status=complaint.status,
-            new_status=new_status,
-            comment=comment
+        complaint_service.record_status_change(
+            complaint.id, current_user_id, complaint.status, new_status, comment
         )
-        complaint.status = new_status
-        
-        if new_status == 'resolved':
-            complaint.resolved_at = datetime.utcnow()
-        
-        db.session.add(status_update)
     
     db.session.commit()
+    invalidate_dashboard()
+    invalidate_officer_dashboard(current_user_id)
+    invalidate_track(complaint_id)
     
     return jsonify({
         'message': 'Complaint updated',
@@ -201,6 +194,7 @@ def add_note(complaint_id):
     
     db.session.add(status_update)
     db.session.commit()
+    invalidate_track(complaint_id)
     
     return jsonify({
         'message': 'Note added',
@@ -215,33 +209,26 @@ def get_department_complaints():
     Get all complaints for officer's department (unassigned or assigned to others)
     """
     current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = get_user_cached(current_user_id)
     
-    if not user or not user.department:
+    if not user or not user['department']:
         return jsonify({'message': 'No department assigned'}), 400
     
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     unassigned_only = request.args.get('unassigned', 'false').lower() == 'true'
     
-    query = Complaint.query.filter_by(department=user.department)
+    query = Complaint.query_with_people().filter_by(department=user['department'])
     
     if unassigned_only:
         query = query.filter(Complaint.officer_id.is_(None))
     
-    query = query.order_by(
-        Complaint.severity_score.desc(),
-        Complaint.created_at.desc()
-    )
-    
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        result = paginate_complaints(query, page, per_page, after=request.args.get('after'))
+    except ValueError as err:
+        return jsonify({'message': str(err)}), 400
     
-    return jsonify({
-        'complaints': [c.to_dict() for c in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page
-    }), 200
+    return jsonify(result), 200
 
 
 @officer_bp.route('/claim/<string:complaint_id>', methods=['POST'])
@@ -251,7 +238,7 @@ def claim_complaint(complaint_id):
     Officer claims an unassigned complaint
     """
     current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = get_user_cached(current_user_id)
     
     complaint = Complaint.query.filter_by(complaint_id=complaint_id).first()
     
@@ -262,23 +249,23 @@ def claim_complaint(complaint_id):
         return jsonify({'message': 'Complaint is already assigned'}), 400
     
     # Verify department match
-    if user.department and complaint.department != user.department:
+    if user and user['department'] and complaint.department != user['department']:
         return jsonify({'message': 'Cannot claim complaints from other departments'}), 403
     
-    complaint.officer_id = current_user_id
-    complaint.status = 'in_progress'
-    
-    # Log the assignment
-    status_update = StatusUpdate(
-        complaint=complaint,
-        user_id=current_user_id,
-        previous_status='pending',
-        new_status='in_progress',
-        comment='Claimed by officer'
+    # Only claim if still unassigned, so concurrent claims cannot both win
+    claimed = complaint_service.record_status_change(
+        complaint.id, current_user_id, 'pending', 'in_progress', 'Claimed by officer',
+        criteria=(Complaint.officer_id.is_(None),),
+        officer_id=current_user_id
     )
+    if not claimed:
+        db.session.rollback()
+        return jsonify({'message': 'Complaint is already assigned'}), 400
     
-    db.session.add(status_update)
     db.session.commit()
+    invalidate_dashboard()
+    invalidate_officer_dashboard(current_user_id)
+    invalidate_track(complaint_id)
     
     return jsonify({
         'message': 'Complaint claimed successfully',
@@ -295,38 +282,39 @@ def get_my_performance():
     current_user_id = int(get_jwt_identity())
     days = request.args.get('days', 30, type=int)
     
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Resolution stats
-    resolved = Complaint.query.filter(
-        Complaint.officer_id == current_user_id,
-        Complaint.resolved_at >= start_date
-    ).count()
-    
-    # Category breakdown
-    category_stats = db.session.query(
-        Complaint.category,
-        func.count(Complaint.id)
-    ).filter(
-        Complaint.officer_id == current_user_id,
-        Complaint.resolved_at >= start_date
-    ).group_by(Complaint.category).all()
-    
-    # Daily resolutions
-    daily_stats = db.session.query(
-        func.date(Complaint.resolved_at).label('date'),
-        func.count(Complaint.id).label('count')
-    ).filter(
-        Complaint.officer_id == current_user_id,
-        Complaint.resolved_at >= start_date
-    ).group_by(func.date(Complaint.resolved_at)).all()
-    
-    return jsonify({
+    cache_key = officer_performance_key(current_user_id, days)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+    
+    today = datetime.utcnow().date()
+    start_day = today - timedelta(days=days)
+    
+    # Pre-aggregated resolutions per day and category, with every day in the
+    # window present (empty days come back with a NULL category)
+    rows = db.session.execute(text("""
+        SELECT d::date AS day, s.category, s.resolved
+        FROM generate_series(CAST(:start_day AS date), CAST(:today AS date), interval '1 day') AS d
+        LEFT JOIN mv_officer_daily s ON s.day = d::date AND s.officer_id = :officer_id
+        ORDER BY d
+    """), {'start_day': start_day, 'today': today, 'officer_id': current_user_id})
+    
+    daily_counts = {}
+    category_counts = {}
+    for row in rows:
+        daily_counts[row.day] = daily_counts.get(row.day, 0) + (row.resolved or 0)
+        if row.category:
+            category_counts[row.category] = category_counts.get(row.category, 0) + row.resolved
+    
+    result = {
         'period_days': days,
-        'total_resolved': resolved,
-        'by_category': dict(category_stats),
+        'total_resolved': sum(daily_counts.values()),
+        'by_category': category_counts,
         'daily_resolutions': [
-            {'date': str(d.date), 'count': d.count}
-            for d in daily_stats
+            {'date': str(day), 'count': count}
+            for day, count in daily_counts.items()
         ]
-    }), 200
+    }
+    cache.set(cache_key, result, timeout=OFFICER_DASHBOARD_TIMEOUT)
+    
+    return jsonify(result), 200
@@ -1,2 +1,2 @@
 """Models package"""
-from app.models.models import User, Complaint, StatusUpdate, Department, ImportantLocation
+from app.models.models import User, Complaint, ComplaintCounter, StatusUpdate, Department, ImportantLocation
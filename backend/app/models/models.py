@@ -3,7 +3,11 @@ CivicLens Database Models
 User, Complaint, and related entities
 """
 from datetime import datetime
-from geoalchemy2 import Geometry
+from flask import current_app
+from geoalchemy2 import Geography
+from sqlalchemy import DDL, MetaData, Table, event
+from sqlalchemy.orm import joinedload, raiseload
+from sqlalchemy.schema import CreateIndex
 from app import db
 
 
@@ -13,6 +17,8 @@ class User(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    # ASCII PHC string ($argon2id$..., or legacy $2b$ bcrypt) stored as text;
+    # hashing returns str, so neither writes nor verifies need encode/decode
     password_hash = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
@@ -24,9 +30,15 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    complaints = db.relationship('Complaint', backref='reporter', lazy='dynamic', foreign_keys='Complaint.user_id')
-    assigned_complaints = db.relationship('Complaint', backref='assigned_officer', lazy='dynamic', foreign_keys='Complaint.officer_id')
-    status_updates = db.relationship('StatusUpdate', backref='updated_by_user', lazy='dynamic')
+    complaints = db.relationship('Complaint', backref='reporter', foreign_keys='Complaint.user_id')
+    assigned_complaints = db.relationship('Complaint', backref='assigned_officer', foreign_keys='Complaint.officer_id')
+    status_updates = db.relationship('StatusUpdate', backref='updated_by_user')
+    
+    # Searchable "email first last" text, matched by the trigram index below
+    search_text = db.column_property(
+        db.func.lower(email + db.literal_column("' '") + first_name + db.literal_column("' '") + last_name),
+        deferred=True
+    )
     
     def to_dict(self):
         return {
@@ -39,16 +51,31 @@ class User(db.Model):
             'role': self.role,
             'department': self.department,
             'is_active': self.is_active,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
 
 
+user_search_ddl = (
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'),
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_users_search_trgm ON users "
+        "USING gin (lower(email || ' ' || first_name || ' ' || last_name) gin_trgm_ops)"
+    ),
+)
+for statement in user_search_ddl:
+    event.listen(User.__table__, 'after_create', statement)
+
+
 class Complaint(db.Model):
     """Main complaint model with geospatial support"""
     __tablename__ = 'complaints'
     
     id = db.Column(db.Integer, primary_key=True)
-    complaint_id = db.Column(db.String(20), unique=True, nullable=False, index=True)  # CL-2026-000001
+    # CL-2026-000001, numbered by the database on INSERT (next_complaint_id())
+    complaint_id = db.Column(
+        db.String(20), unique=True, nullable=False, index=True,
+        server_default=db.text('next_complaint_id()')
+    )
     
     # Reporter info
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -64,7 +91,9 @@ class Complaint(db.Model):
     address = db.Column(db.String(500))
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
-    location = db.Column(Geometry('POINT', srid=4326))  # PostGIS geometry
+    # PostGIS geography (metre-based distances, GiST-indexed); only used
+    # inside spatial SQL, so never loaded with the row
+    location = db.deferred(db.Column(Geography('POINT', srid=4326, spatial_index=False)))
     ward = db.Column(db.String(100))
     zone = db.Column(db.String(100))
     
@@ -91,11 +120,61 @@ class Complaint(db.Model):
     duplicate_of_id = db.Column(db.Integer, db.ForeignKey('complaints.id'))
     escalation_level = db.Column(db.Integer, default=0)
     
+    # Composite/partial indexes for the admin and analytics filter predicates
+    __table_args__ = (
+        db.Index('ix_complaints_location', 'location', postgresql_using='gist'),
+        db.Index('ix_complaints_resolved_at', 'resolved_at', postgresql_where=db.text('resolved_at IS NOT NULL')),
+        db.Index(
+            'ix_complaints_resolved_awaiting_close', 'resolved_at',
+            postgresql_where=db.text("status = 'resolved'")
+        ),
+        db.Index('ix_complaints_status_created', 'status', 'created_at'),
+        db.Index('ix_complaints_officer_status', 'officer_id', 'status'),
+        db.Index(
+            'ix_complaints_officer_resolved', 'officer_id', 'resolved_at',
+            postgresql_where=db.text('resolved_at IS NOT NULL')
+        ),
+        db.Index('ix_complaints_dept_status', 'department', 'status'),
+        db.Index('ix_complaints_category_created', 'category', 'created_at'),
+        db.Index('ix_complaints_category_status', 'category', 'status'),
+        db.Index(
+            'ix_complaints_severity_created_id',
+            db.desc('severity_score'), db.desc('created_at'), db.desc('id')
+        ),
+        db.Index(
+            'ix_complaints_priority_status', 'priority', 'status',
+            postgresql_where=db.text("status IN ('pending', 'in_progress')")
+        ),
+        # Complaints still waiting for (or that missed) AI classification
+        db.Index('ix_complaints_unclassified', 'id', postgresql_where=db.text('ai_category IS NULL')),
+        # Open-workload lookups (similar complaints, auto-assign load counts)
+        db.Index(
+            'ix_complaints_open_category', 'category',
+            postgresql_where=db.text("status IN ('pending', 'in_progress')")
+        ),
+        db.Index(
+            'ix_complaints_officer_open', 'officer_id',
+            postgresql_where=db.text("status IN ('pending', 'in_progress')")
+        ),
+    )
+    
     # Relationships
-    status_updates = db.relationship('StatusUpdate', backref='complaint', lazy='dynamic', order_by='StatusUpdate.created_at.desc()')
-    duplicates = db.relationship('Complaint', backref=db.backref('original_complaint', remote_side=[id]), lazy='dynamic')
+    status_updates = db.relationship('StatusUpdate', backref='complaint', order_by='StatusUpdate.created_at.desc()')
+    duplicates = db.relationship('Complaint', backref=db.backref('original_complaint', remote_side=[id]))
+    
+    @classmethod
+    def query_with_people(cls):
+        """
+        Complaint query that loads the reporter and officer in the same SELECT
+        In debug mode any other lazy load raises, to catch new N+1s early
+        """
+        query = cls.query.options(joinedload(cls.reporter), joinedload(cls.assigned_officer))
+        if current_app.debug:
+            query = query.options(raiseload('*'))
+        return query
     
     def to_dict(self, include_updates=False):
+        # Datetimes stay raw; the orjson JSON provider writes them as ISO 8601
         result = {
             'id': self.id,
             'complaint_id': self.complaint_id,
@@ -116,19 +195,156 @@ class Complaint(db.Model):
             'department': self.department,
             'reporter': self.reporter.to_dict() if self.reporter else None,
             'officer': self.assigned_officer.to_dict() if self.assigned_officer else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'resolved_at': self.resolved_at,
             'escalation_level': self.escalation_level,
             'is_duplicate': self.is_duplicate
         }
         
         if include_updates:
-            result['status_updates'] = [update.to_dict() for update in self.status_updates.limit(10).all()]
+            result['status_updates'] = [update.to_dict() for update in self.status_updates[:10]]
         
         return result
 
 
+# Daily pre-aggregated complaint counts backing the analytics endpoints.
+# Refreshed out of band (`flask refresh-analytics`), so it is kept out of
+# db.metadata and created/dropped alongside the complaints table instead.
+complaints_daily = Table(
+    'mv_complaints_daily', MetaData(),
+    db.Column('day', db.Date),
+    db.Column('category', db.String(50)),
+    db.Column('department', db.String(100)),
+    db.Column('zone', db.String(100)),
+    db.Column('priority', db.String(20)),
+    db.Column('total', db.Integer),
+    db.Column('resolved', db.Integer),
+    db.Column('pending', db.Integer),
+    db.Column('severity_sum', db.Float),
+    db.Column('severity_count', db.Integer),
+    db.Column('resolution_hours_sum', db.Numeric),
+    db.Column('resolution_count', db.Integer)
+)
+
+complaints_daily_ddl = (
+    DDL("""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_complaints_daily AS
+    SELECT
+        date(created_at) AS day,
+        category,
+        department,
+        zone,
+        priority,
+        count(*)::int AS total,
+        (count(*) FILTER (WHERE status = 'resolved'))::int AS resolved,
+        (count(*) FILTER (WHERE status = 'pending'))::int AS pending,
+        sum(severity_score) AS severity_sum,
+        count(severity_score)::int AS severity_count,
+        sum(extract(epoch FROM resolved_at - created_at) / 3600) AS resolution_hours_sum,
+        count(resolved_at)::int AS resolution_count
+    FROM complaints
+    GROUP BY 1, 2, 3, 4, 5
+    """),
+    # Unique index required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+    DDL(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_complaints_daily '
+        'ON mv_complaints_daily (day, category, department, zone, priority)'
+    ),
+)
+for statement in complaints_daily_ddl:
+    event.listen(Complaint.__table__, 'after_create', statement)
+event.listen(Complaint.__table__, 'before_drop', DDL('DROP MATERIALIZED VIEW IF EXISTS mv_complaints_daily'))
+
+
+# Daily resolutions per officer and category backing officer performance,
+# refreshed together with mv_complaints_daily
+officer_daily_ddl = (
+    DDL("""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_officer_daily AS
+    SELECT
+        officer_id,
+        date(resolved_at) AS day,
+        category,
+        count(*)::int AS resolved
+    FROM complaints
+    WHERE officer_id IS NOT NULL AND resolved_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    """),
+    DDL(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_officer_daily '
+        'ON mv_officer_daily (officer_id, day, category)'
+    ),
+)
+for statement in officer_daily_ddl:
+    event.listen(Complaint.__table__, 'after_create', statement)
+event.listen(Complaint.__table__, 'before_drop', DDL('DROP MATERIALIZED VIEW IF EXISTS mv_officer_daily'))
+
+
+class ComplaintCounter(db.Model):
+    """Per-year sequence backing complaint IDs (CL-YYYY-NNNNNN)"""
+    __tablename__ = 'complaint_counters'
+    
+    year = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# Complaint ID generator used as the complaints.complaint_id default; must
+# exist before the complaints table (the counters table is only resolved
+# when it runs)
+next_complaint_id_function = DDL("""
+    CREATE OR REPLACE FUNCTION next_complaint_id() RETURNS varchar AS $$
+    DECLARE
+        current_year int := extract(year FROM now() AT TIME ZONE 'utc');
+        number bigint;
+    BEGIN
+        INSERT INTO complaint_counters (year, value) VALUES (current_year, 1)
+        ON CONFLICT (year) DO UPDATE SET value = complaint_counters.value + 1
+        RETURNING value INTO number;
+        RETURN 'CL-' || current_year || '-' || lpad(number::text, 6, '0');
+    END;
+    $$ LANGUAGE plpgsql
+""")
+event.listen(Complaint.__table__, 'before_create', next_complaint_id_function)
+event.listen(Complaint.__table__, 'after_drop', DDL('DROP FUNCTION IF EXISTS next_complaint_id()'))
+
+# Continue numbering from any complaint IDs that predate the counters table
+event.listen(ComplaintCounter.__table__, 'after_create', DDL("""
+    DO $$
+    BEGIN
+        IF to_regclass('complaints') IS NOT NULL THEN
+            INSERT INTO complaint_counters (year, value)
+            SELECT split_part(complaint_id, '-', 2)::int, max(split_part(complaint_id, '-', 3)::bigint)
+            FROM complaints
+            WHERE complaint_id ~ '^CL-[0-9]{4}-[0-9]+$'
+            GROUP BY 1;
+        END IF;
+    END $$
+"""))
+
+
+def upgrade_schema():
+    """Install routines, views and indexes on databases created by older releases"""
+    # create_all() skips existing tables, so their create listeners never
+    # fire there; every statement here must be safe to re-run
+    for statement in (
+        next_complaint_id_function,
+        DDL('ALTER TABLE complaints ALTER COLUMN complaint_id SET DEFAULT next_complaint_id()'),
+        seed_status_function,
+        *seed_status_triggers,
+        *complaints_daily_ddl,
+        *officer_daily_ddl,
+        *user_search_ddl,
+    ):
+        db.session.execute(statement)
+    
+    # Indexes declared on the models after their tables were created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+    db.session.commit()
+
+
 class StatusUpdate(db.Model):
     """Status update history for complaints"""
     __tablename__ = 'status_updates'
@@ -149,10 +365,34 @@ class StatusUpdate(db.Model):
             'new_status': self.new_status,
             'comment': self.comment,
             'updated_by': self.updated_by_user.to_dict() if self.updated_by_user else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
 
 
+# Every new complaint starts with a 'Complaint submitted' history entry
+seed_status_function = DDL("""
+    CREATE OR REPLACE FUNCTION seed_status_update() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO status_updates (complaint_id, user_id, new_status, comment, created_at)
+        VALUES (NEW.id, NEW.user_id, 'pending', 'Complaint submitted',
+                COALESCE(NEW.created_at, now() AT TIME ZONE 'utc'));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+""")
+seed_status_triggers = (
+    DDL('DROP TRIGGER IF EXISTS trg_complaints_seed_status ON complaints'),
+    DDL("""
+        CREATE TRIGGER trg_complaints_seed_status
+            AFTER INSERT ON complaints
+            FOR EACH ROW EXECUTE FUNCTION seed_status_update()
+    """),
+)
+for statement in (seed_status_function, *seed_status_triggers):
+    event.listen(StatusUpdate.__table__, 'after_create', statement)
+event.listen(StatusUpdate.__table__, 'before_drop', DDL('DROP FUNCTION IF EXISTS seed_status_update() CASCADE'))
+
+
 class ImportantLocation(db.Model):
     """Important locations for severity calculation"""
     __tablename__ = 'important_locations'
@@ -162,9 +402,14 @@ class ImportantLocation(db.Model):
     location_type = db.Column(db.String(50), nullable=False)  # hospital, school, etc.
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
-    location = db.Column(Geometry('POINT', srid=4326))
+    # Same geography type as Complaint.location, so distance joins stay in metres
+    location = db.Column(Geography('POINT', srid=4326, spatial_index=False))
     importance_weight = db.Column(db.Float, default=1.0)
     
+    __table_args__ = (
+        db.Index('ix_important_locations_location', 'location', postgresql_using='gist'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -2,11 +2,94 @@
 AI Service for Complaint Processing
 NLP-based categorization and severity scoring
 """
+import hashlib
 import os
 import re
 import math
-from typing import Dict, Tuple, Optional
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple, Optional
+import ahocorasick
+import numpy as np
+from cachetools import TTLCache
 from flask import current_app
+from sqlalchemy import text as sql_text
+from app import db
+
+# Location references in complaint text
+LOCATION_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'near\s+(\w+(?:\s+\w+){0,3})',
+        r'at\s+(\w+(?:\s+\w+){0,3})',
+        r'in\s+(\w+(?:\s+\w+){0,2})\s+area',
+        r'(\w+)\s+road',
+        r'(\w+)\s+street'
+    )
+]
+NUMBER_PATTERN = re.compile(r'\b\d+\b')
+
+# Five nearest important places (KNN over the GiST index), each weighted
+# down linearly to nothing at 1 km
+LOCATION_IMPORTANCE_SQL = sql_text("""
+    SELECT count(*) AS places,
+           max(importance_weight * greatest(0, 1 - distance / 1000)) AS importance
+    FROM (
+        SELECT importance_weight,
+               ST_Distance(location, origin) AS distance
+        FROM important_locations,
+             CAST(ST_SetSRID(ST_MakePoint(:lng, :lat), 4326) AS geography) AS origin
+        ORDER BY location <-> origin
+        LIMIT 5
+    ) AS nearest
+""")
+
+# Open complaints of the same category within 500 m
+NEARBY_COMPLAINTS_SQL = sql_text("""
+    SELECT count(*)
+    FROM complaints
+    WHERE category = :category
+      AND status IN ('pending', 'in_progress')
+      AND ST_DWithin(location, CAST(ST_SetSRID(ST_MakePoint(:lng, :lat), 4326) AS geography), 500)
+      AND id IS DISTINCT FROM :exclude_id
+""")
+NEARBY_SATURATION = 10  # this many similar complaints nearby scores 1.0
+
+DEFAULT_SEVERITY_WEIGHTS = MappingProxyType({
+    'keyword_urgency': 0.3,
+    'nearby_complaints': 0.2,
+    'time_unresolved': 0.2,
+    'location_importance': 0.3
+})
+
+
+def _severity_weights() -> Mapping[str, float]:
+    """Severity weights from config, or the defaults outside an app context"""
+    try:
+        return current_app.config.get('SEVERITY_WEIGHTS', DEFAULT_SEVERITY_WEIGHTS)
+    except RuntimeError:
+        return DEFAULT_SEVERITY_WEIGHTS
+
+
+def _build_automaton(keyword_groups: Dict[str, list]) -> ahocorasick.Automaton:
+    """Aho-Corasick automaton mapping each keyword to (group, keyword)"""
+    automaton = ahocorasick.Automaton()
+    for group, keywords in keyword_groups.items():
+        for keyword in keywords:
+            automaton.add_word(keyword, (group, keyword))
+    automaton.make_automaton()
+    return automaton
+
+
+def _count_keyword_hits(automaton: ahocorasick.Automaton, text_lower: str) -> Dict[str, int]:
+    """
+    Number of distinct keywords per group occurring in the text, found in a
+    single pass (overlapping and nested keywords included)
+    """
+    counts = {}
+    for group, _ in {value for _, value in automaton.iter(text_lower)}:
+        counts[group] = counts.get(group, 0) + 1
+    return counts
 
 
 class AIService:
@@ -76,6 +159,16 @@ class AIService:
                 'garden', 'plant', 'animal', 'stray', 'mosquito', 'pest'
             ]
         }
+        self._category_automaton = _build_automaton(self.category_keywords)
+        self._urgency_automaton = _build_automaton(self.urgency_keywords)
+        
+        # Recent process_complaint results; expire so location-dependent
+        # factors are not frozen
+        self._results = TTLCache(maxsize=4096, ttl=300)
+        self._results_lock = threading.Lock()
+        
+        # Text-only analysis is location independent, so it is kept longer
+        self._analyze = lru_cache(maxsize=2048)(self._analyze_text)
     
     def load_model(self):
         """
@@ -96,15 +189,15 @@ class AIService:
         Classify complaint text into category
         Returns (category, confidence)
         """
-        text_lower = text.lower()
-        
-        # Keyword-based classification only
-        category_scores = {}
-        
-        for category, keywords in self.category_keywords.items():
-            score = sum(1 for kw in keywords if kw in text_lower)
-            if score > 0:
-                category_scores[category] = score
+        return self._classify_lower(text.lower())
+    
+    def _classify_lower(self, text_lower: str) -> Tuple[str, float]:
+        # Keyword-based classification only, scored in one pass over the text
+        hits = _count_keyword_hits(self._category_automaton, text_lower)
+        category_scores = {
+            category: hits[category]
+            for category in self.category_keywords if category in hits
+        }
         
         if category_scores:
             best_category = max(category_scores, key=category_scores.get)
@@ -120,22 +213,23 @@ class AIService:
         Calculate urgency score based on keywords
         Returns score between 0 and 1
         """
-        text_lower = text.lower()
+        return self._urgency_lower(text.lower())
+    
+    def _urgency_lower(self, text_lower: str) -> float:
+        # All urgency levels counted in one pass over the text
+        counts = _count_keyword_hits(self._urgency_automaton, text_lower)
         
-        # Check for critical keywords first
-        for keyword in self.urgency_keywords['critical']:
-            if keyword in text_lower:
-                return 1.0
+        # Any critical keyword is maximally urgent
+        if counts.get('critical'):
+            return 1.0
         
-        # Calculate weighted score
-        critical_count = sum(1 for kw in self.urgency_keywords['critical'] if kw in text_lower)
-        high_count = sum(1 for kw in self.urgency_keywords['high'] if kw in text_lower)
-        medium_count = sum(1 for kw in self.urgency_keywords['medium'] if kw in text_lower)
-        low_count = sum(1 for kw in self.urgency_keywords['low'] if kw in text_lower)
+        high_count = counts.get('high', 0)
+        medium_count = counts.get('medium', 0)
+        low_count = counts.get('low', 0)
         
         # Weighted calculation
-        score = (critical_count * 1.0 + high_count * 0.7 + medium_count * 0.4 + low_count * 0.1)
-        total = critical_count + high_count + medium_count + low_count
+        score = high_count * 0.7 + medium_count * 0.4 + low_count * 0.1
+        total = high_count + medium_count + low_count
         
         if total > 0:
             return min(score / total, 1.0)
@@ -145,20 +239,40 @@ class AIService:
     def calculate_location_importance(self, latitude: float, longitude: float) -> float:
         """
         Calculate location importance based on proximity to important places
-        In production, this would query the ImportantLocation table
+        Falls back to 0.5 when no important places are registered
         """
-        # Placeholder - would integrate with PostGIS queries
-        # For now, return a default value
-        return 0.5
+        try:
+            row = db.session.execute(
+                LOCATION_IMPORTANCE_SQL, {'lat': latitude, 'lng': longitude}
+            ).one()
+        except RuntimeError:
+            return 0.5
+        
+        if not row.places:
+            return 0.5
+        
+        return min(float(row.importance or 0), 1.0)
     
-    def get_nearby_complaint_factor(self, latitude: float, longitude: float, category: str) -> float:
+    def get_nearby_complaint_factor(
+        self,
+        latitude: float,
+        longitude: float,
+        category: str,
+        exclude_id: Optional[int] = None
+    ) -> float:
         """
         Calculate factor based on similar complaints nearby
-        Higher score if there are many similar complaints in the area
+        Higher score if there are many similar complaints in the area;
+        exclude_id leaves the complaint being scored out of the count
         """
-        # This would query the database in production
-        # For now, return a default value
-        return 0.3
+        try:
+            nearby = db.session.execute(NEARBY_COMPLAINTS_SQL, {
+                'category': category, 'lat': latitude, 'lng': longitude, 'exclude_id': exclude_id
+            }).scalar()
+        except RuntimeError:
+            return 0.3
+        
+        return min(nearby / NEARBY_SATURATION, 1.0)
     
     def calculate_severity_score(
         self,
@@ -166,7 +280,9 @@ class AIService:
         category: str,
         latitude: float,
         longitude: float,
-        time_unresolved_hours: float = 0
+        time_unresolved_hours: float = 0,
+        keyword_score: Optional[float] = None,
+        exclude_id: Optional[int] = None
     ) -> float:
         """
         Calculate comprehensive severity score using:
@@ -175,26 +291,13 @@ class AIService:
         - Time unresolved
         - Location importance
         """
-        # Get weights from config or use defaults
-        try:
-            weights = current_app.config.get('SEVERITY_WEIGHTS', {
-                'keyword_urgency': 0.3,
-                'nearby_complaints': 0.2,
-                'time_unresolved': 0.2,
-                'location_importance': 0.3
-            })
-        except RuntimeError:
-            weights = {
-                'keyword_urgency': 0.3,
-                'nearby_complaints': 0.2,
-                'time_unresolved': 0.2,
-                'location_importance': 0.3
-            }
+        weights = _severity_weights()
         
         # Calculate individual components
-        keyword_score = self.calculate_keyword_urgency(text)
+        if keyword_score is None:
+            keyword_score = self.calculate_keyword_urgency(text)
         location_score = self.calculate_location_importance(latitude, longitude)
-        nearby_score = self.get_nearby_complaint_factor(latitude, longitude, category)
+        nearby_score = self.get_nearby_complaint_factor(latitude, longitude, category, exclude_id)
         
         # Time factor - increases with time unresolved (caps at 1.0)
         time_factor = min(time_unresolved_hours / 168, 1.0)  # 168 hours = 1 week
@@ -209,6 +312,23 @@ class AIService:
         
         return round(min(severity, 1.0), 3)
     
+    def score_batch(self, components: Mapping) -> np.ndarray:
+        """
+        Vectorized calculate_severity_score for many complaints at once.
+        `components` maps keyword_score, location_score, nearby_score and
+        time_factor to equal-length arrays (a DataFrame works as-is).
+        """
+        weights = _severity_weights()
+        
+        severity = (
+            weights['keyword_urgency'] * np.asarray(components['keyword_score'], dtype=float) +
+            weights['nearby_complaints'] * np.asarray(components['nearby_score'], dtype=float) +
+            weights['time_unresolved'] * np.asarray(components['time_factor'], dtype=float) +
+            weights['location_importance'] * np.asarray(components['location_score'], dtype=float)
+        )
+        
+        return np.round(np.clip(severity, 0, 1.0), 3)
+    
     def get_priority_from_score(self, severity_score: float) -> str:
         """Convert severity score to priority level"""
         if severity_score >= 0.8:
@@ -225,23 +345,60 @@ class AIService:
         text: str,
         category: Optional[str] = None,
         latitude: float = 0,
-        longitude: float = 0
+        longitude: float = 0,
+        complaint_pk: Optional[int] = None
     ) -> Dict:
         """
         Main entry point for AI processing of complaints
+        Results are memoized, since duplicate reports often repeat the same
+        description at (nearly) the same spot. complaint_pk is the stored
+        complaint being processed, kept out of its own nearby count
         """
-        # Classify category
-        ai_category, confidence = self.classify_category(text)
+        text_lower = text.lower()
+        key = (
+            hashlib.blake2b(text_lower.encode('utf-8'), digest_size=8).digest(),
+            category,
+            round(latitude, 3),
+            round(longitude, 3)
+        )
+        
+        with self._results_lock:
+            result = self._results.get(key)
+        
+        if result is None:
+            result = self._process(text_lower, category, latitude, longitude, complaint_pk)
+            with self._results_lock:
+                self._results[key] = result
+        
+        return dict(result)
+    
+    def _analyze_text(self, text_lower: str) -> Tuple[str, float, float]:
+        """(category, confidence, keyword urgency) for already lower-cased text"""
+        category, confidence = self._classify_lower(text_lower)
+        return category, confidence, self._urgency_lower(text_lower)
+    
+    def _process(
+        self,
+        text_lower: str,
+        category: Optional[str],
+        latitude: float,
+        longitude: float,
+        complaint_pk: Optional[int] = None
+    ) -> Dict:
+        # Classify category and score urgency (cached per text)
+        ai_category, confidence, keyword_score = self._analyze(text_lower)
         
         # Use user-provided category if available and valid
         final_category = category if category in self.categories else ai_category
         
         # Calculate severity
         severity_score = self.calculate_severity_score(
-            text=text,
+            text=text_lower,
             category=final_category,
             latitude=latitude,
-            longitude=longitude
+            longitude=longitude,
+            keyword_score=keyword_score,
+            exclude_id=complaint_pk
         )
         
         # Determine priority
@@ -277,20 +434,11 @@ class AIService:
         }
         
         # Extract potential location references
-        location_patterns = [
-            r'near\s+(\w+(?:\s+\w+){0,3})',
-            r'at\s+(\w+(?:\s+\w+){0,3})',
-            r'in\s+(\w+(?:\s+\w+){0,2})\s+area',
-            r'(\w+)\s+road',
-            r'(\w+)\s+street'
-        ]
-        
-        for pattern in location_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            entities['locations'].extend(matches)
+        for pattern in LOCATION_PATTERNS:
+            entities['locations'].extend(pattern.findall(text))
         
         # Extract numbers (could be address, phone, etc.)
-        numbers = re.findall(r'\b\d+\b', text)
+        numbers = NUMBER_PATTERN.findall(text)
         entities['numbers'] = numbers
         
         return entities
@@ -3,10 +3,29 @@ Complaint Service
 Business logic for complaint management
 """
 from datetime import datetime, timedelta
+from types import MappingProxyType
 from typing import Optional, List, Dict
-from sqlalchemy import func
+import numpy as np
+from geoalchemy2 import Geography
+from sqlalchemy import and_, cast, func, insert, lambda_stmt, or_, select, text, true, update
+from sqlalchemy.orm import aliased
 from app import db
-from app.models.models import Complaint, StatusUpdate, User, Department
+from app.models.models import Complaint, StatusUpdate, User, Department, ImportantLocation
+from app.services.ai_service import NEARBY_SATURATION
+
+
+# Department mappings for categories (read-only, shared by all callers)
+DEFAULT_DEPARTMENT = 'General Administration'
+CATEGORY_DEPARTMENT_MAP = MappingProxyType({
+    'roads': 'Public Works Department',
+    'water': 'Water Supply Department',
+    'sanitation': 'Sanitation Department',
+    'safety': 'Public Safety Department',
+    'electricity': 'Electricity Department',
+    'public_transport': 'Transport Department',
+    'environment': 'Environment Department',
+    'other': DEFAULT_DEPARTMENT
+})
 
 
 class ComplaintService:
@@ -14,21 +33,19 @@ class ComplaintService:
     Service class for complaint-related business operations
     """
     
-    # Department mappings for categories
-    CATEGORY_DEPARTMENT_MAP = {
-        'roads': 'Public Works Department',
-        'water': 'Water Supply Department',
-        'sanitation': 'Sanitation Department',
-        'safety': 'Public Safety Department',
-        'electricity': 'Electricity Department',
-        'public_transport': 'Transport Department',
-        'environment': 'Environment Department',
-        'other': 'General Administration'
-    }
+    CATEGORY_DEPARTMENT_MAP = CATEGORY_DEPARTMENT_MAP
+    
+    # Escalation thresholds (in hours) by priority
+    ESCALATION_THRESHOLDS = MappingProxyType({
+        'critical': 4,
+        'high': 24,
+        'medium': 72,
+        'low': 168
+    })
     
     def get_department_for_category(self, category: str) -> str:
         """Get the appropriate department for a category"""
-        return self.CATEGORY_DEPARTMENT_MAP.get(category, 'General Administration')
+        return CATEGORY_DEPARTMENT_MAP.get(category, DEFAULT_DEPARTMENT)
     
     def check_escalation(self, complaint: Complaint) -> bool:
         """
@@ -38,15 +55,7 @@ class ComplaintService:
         if complaint.status in ['resolved', 'closed']:
             return False
         
-        # Get escalation thresholds (in hours)
-        thresholds = {
-            'critical': 4,
-            'high': 24,
-            'medium': 72,
-            'low': 168
-        }
-        
-        threshold_hours = thresholds.get(complaint.priority, 72)
+        threshold_hours = self.ESCALATION_THRESHOLDS.get(complaint.priority, 72)
         hours_pending = (datetime.utcnow() - complaint.created_at).total_seconds() / 3600
         
         if hours_pending > threshold_hours and complaint.escalation_level == 0:
@@ -70,35 +79,33 @@ class ComplaintService:
         if not department:
             return None
         
+        # Hot, fixed-shape statements: lambda_stmt caches their construction
+        # and compilation, with closure variables becoming bound parameters
+        
         # Find officers in the department
-        officers = User.query.filter_by(
-            role='officer',
-            department=department,
-            is_active=True
-        ).all()
+        officers = db.session.scalars(lambda_stmt(lambda: select(User).where(
+            User.role == 'officer',
+            User.department == department,
+            User.is_active == True
+        ))).all()
         
         if not officers:
             return None
         
-        # Find officer with least pending complaints
-        min_load = float('inf')
-        selected_officer = None
-        
-        for officer in officers:
-            pending_count = Complaint.query.filter(
-                Complaint.officer_id == officer.id,
-                Complaint.status.in_(['pending', 'in_progress'])
-            ).count()
-            
-            if pending_count < min_load:
-                min_load = pending_count
-                selected_officer = officer
-        
-        if selected_officer:
-            complaint.officer_id = selected_officer.id
-            return selected_officer
+        # Open workload for all of them in one grouped query
+        officer_ids = [o.id for o in officers]
+        loads = dict(db.session.execute(lambda_stmt(lambda: select(
+            Complaint.officer_id,
+            func.count(Complaint.id)
+        ).where(
+            Complaint.officer_id.in_(officer_ids),
+            Complaint.status.in_(['pending', 'in_progress'])
+        ).group_by(Complaint.officer_id))).all())
         
-        return None
+        # Officer with least pending complaints (first one wins ties)
+        selected_officer = min(officers, key=lambda o: loads.get(o.id, 0))
+        complaint.officer_id = selected_officer.id
+        return selected_officer
     
     def get_similar_complaints(
         self,
@@ -110,17 +117,58 @@ class ComplaintService:
         """
         Find similar complaints in the vicinity
         """
-        # This would use PostGIS in production
-        # Simple distance calculation for now
-        complaints = Complaint.query.filter(
+        # Index-backed radius search on the GiST-indexed geography column
+        radius_m = radius_km * 1000
+        complaints = db.session.scalars(lambda_stmt(lambda: select(Complaint).where(
             Complaint.category == category,
             Complaint.status.in_(['pending', 'in_progress']),
-            func.abs(Complaint.latitude - latitude) < radius_km / 111,  # Approximate conversion
-            func.abs(Complaint.longitude - longitude) < radius_km / 111
-        ).all()
+            func.ST_DWithin(
+                Complaint.location,
+                cast(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326), Geography),
+                radius_m
+            )
+        ))).all()
         
         return complaints
     
+    def record_status_change(
+        self,
+        complaint_pk: int,
+        user_id: int,
+        previous_status: str,
+        new_status: str,
+        comment: str = '',
+        criteria: tuple = (),
+        **changes
+    ) -> bool:
+        """
+        Move a complaint to new_status (applying any other column changes)
+        and log it, as one UPDATE and one INSERT without loading ORM objects.
+        Extra criteria guard the UPDATE; returns False if no row matched.
+        Caller commits.
+        """
+        values = dict(changes, status=new_status)
+        if new_status == 'resolved':
+            values.setdefault('resolved_at', datetime.utcnow())
+        
+        result = db.session.execute(
+            update(Complaint)
+            .where(Complaint.id == complaint_pk, *criteria)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            return False
+        
+        db.session.execute(insert(StatusUpdate).values(
+            complaint_id=complaint_pk,
+            user_id=user_id,
+            previous_status=previous_status,
+            new_status=new_status,
+            comment=comment
+        ))
+        return True
+    
     def mark_as_duplicate(
         self,
         complaint: Complaint,
@@ -132,21 +180,26 @@ class ComplaintService:
         if complaint.id == original_complaint.id:
             return False
         
-        complaint.is_duplicate = True
-        complaint.duplicate_of_id = original_complaint.id
+        db.session.execute(
+            update(Complaint)
+            .where(Complaint.id == complaint.id)
+            .values(is_duplicate=True, duplicate_of_id=original_complaint.id)
+        )
         
-        # Increase severity of original if multiple duplicates
-        duplicate_count = Complaint.query.filter_by(
-            duplicate_of_id=original_complaint.id
-        ).count()
-        
-        if duplicate_count > 0:
-            # Boost severity score for original complaint
-            boost = min(duplicate_count * 0.1, 0.3)
-            original_complaint.severity_score = min(
-                original_complaint.severity_score + boost,
+        # Boost severity of the original by its duplicate count, counted
+        # inside the UPDATE so concurrent markings cannot race
+        duplicate_count = select(func.count(Complaint.id)).where(
+            Complaint.duplicate_of_id == original_complaint.id
+        ).scalar_subquery()
+        db.session.execute(
+            update(Complaint)
+            .where(Complaint.id == original_complaint.id)
+            .values(severity_score=func.least(
+                Complaint.severity_score + func.least(duplicate_count * 0.1, 0.3),
                 1.0
-            )
+            ))
+            .execution_options(synchronize_session='fetch')
+        )
         
         return True
     
@@ -156,19 +209,23 @@ class ComplaintService:
         """
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        total = Complaint.query.filter(Complaint.created_at >= start_date).count()
-        resolved = Complaint.query.filter(
-            Complaint.resolved_at >= start_date
-        ).count()
+        created_in_period = Complaint.created_at >= start_date
+        resolved_in_period = Complaint.resolved_at >= start_date
         
-        # Average resolution time
-        avg_time = db.session.query(
+        # Created/resolved counts and average resolution time in one pass
+        stats = db.session.query(
+            func.count(Complaint.id).filter(created_in_period).label('total'),
+            func.count(Complaint.id).filter(resolved_in_period).label('resolved'),
             func.avg(
                 func.extract('epoch', Complaint.resolved_at - Complaint.created_at) / 3600
-            )
+            ).filter(resolved_in_period).label('avg_time')
         ).filter(
-            Complaint.resolved_at >= start_date
-        ).scalar() or 0
+            or_(created_in_period, resolved_in_period)
+        ).one()
+        
+        total = stats.total
+        resolved = stats.resolved
+        avg_time = float(stats.avg_time or 0)
         
         return {
             'period_days': days,
@@ -183,17 +240,160 @@ class ComplaintService:
         Run escalation check on all pending complaints
         Returns number of escalated complaints
         """
-        pending = Complaint.query.filter(
-            Complaint.status.in_(['pending', 'in_progress'])
+        now = datetime.utcnow()
+        
+        def overdue(multiplier: int):
+            # Same per-priority thresholds as check_escalation (72h otherwise)
+            return or_(
+                *[
+                    and_(
+                        Complaint.priority == priority,
+                        Complaint.created_at < now - timedelta(hours=hours * multiplier)
+                    )
+                    for priority, hours in self.ESCALATION_THRESHOLDS.items()
+                ],
+                and_(
+                    or_(Complaint.priority.is_(None), Complaint.priority.notin_(self.ESCALATION_THRESHOLDS)),
+                    Complaint.created_at < now - timedelta(hours=72 * multiplier)
+                )
+            )
+        
+        is_open = Complaint.status.in_(['pending', 'in_progress'])
+        
+        # Second level first, so a complaint moves up at most one level per run
+        second = db.session.execute(
+            update(Complaint)
+            .where(is_open, Complaint.escalation_level == 1, overdue(2))
+            .values(escalation_level=2)
+            .execution_options(synchronize_session=False)
+        )
+        first = db.session.execute(
+            update(Complaint)
+            .where(is_open, Complaint.escalation_level == 0, overdue(1))
+            .values(escalation_level=1, escalated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        
+        db.session.commit()
+        return first.rowcount + second.rowcount
+    
+    def rescore_open_complaints(self, ai_service) -> int:
+        """
+        Recompute severity and priority for every open complaint, now that
+        time unresolved has grown. Location importance and the nearby count
+        are computed set-based in the batch query; rows are streamed from a
+        server-side cursor, each batch is scored as one array and written back
+        in a single executemany UPDATE. Returns number of rescored complaints.
+        """
+        open_statuses = ['pending', 'in_progress']
+        
+        # Five closest important places, aggregated per complaint (KNN on the GiST index)
+        nearest = select(
+            ImportantLocation.importance_weight,
+            func.ST_Distance(ImportantLocation.location, Complaint.location).label('distance')
+        ).order_by(
+            ImportantLocation.location.op('<->')(Complaint.location)
+        ).limit(5).correlate(Complaint).subquery('nearest')
+        places = select(
+            func.count().label('places'),
+            func.max(
+                nearest.c.importance_weight * func.greatest(0, 1 - nearest.c.distance / 1000)
+            ).label('importance')
+        ).lateral('places')
+        
+        similar = aliased(Complaint)
+        nearby = select(func.count()).where(
+            similar.id != Complaint.id,
+            similar.category == Complaint.category,
+            similar.status.in_(open_statuses),
+            func.ST_DWithin(similar.location, Complaint.location, 500)
+        ).scalar_subquery()
+        
+        stmt = select(
+            Complaint.id,
+            Complaint.description,
+            places.c.places,
+            places.c.importance,
+            nearby.label('nearby'),
+            (func.extract('epoch', func.timezone('utc', func.now()) - Complaint.created_at) / 3600).label('hours')
+        ).join(
+            places, true()
+        ).where(
+            Complaint.status.in_(open_statuses)
+        ).execution_options(yield_per=1000)
+        
+        rescored = 0
+        for rows in db.session.execute(stmt).partitions():
+            hours = np.array([float(row.hours or 0) for row in rows])
+            places_found = np.array([row.places for row in rows])
+            importance = np.array([float(row.importance or 0) for row in rows])
+            nearby_counts = np.array([row.nearby for row in rows], dtype=float)
+            scores = ai_service.score_batch({
+                'keyword_score': [ai_service.calculate_keyword_urgency(row.description) for row in rows],
+                # 0.5 when no important places are registered, as in calculate_location_importance
+                'location_score': np.where(places_found > 0, np.minimum(importance, 1.0), 0.5),
+                'nearby_score': np.minimum(nearby_counts / NEARBY_SATURATION, 1.0),
+                'time_factor': np.minimum(hours / 168, 1.0)  # 168 hours = 1 week
+            })
+            
+            db.session.execute(update(Complaint), [
+                {
+                    'id': row.id,
+                    'severity_score': float(score),
+                    'priority': ai_service.get_priority_from_score(score)
+                }
+                for row, score in zip(rows, scores)
+            ])
+            rescored += len(rows)
+        
+        # Commit once at the end; committing mid-stream would close the cursor
+        db.session.commit()
+        return rescored
+    
+    def apply_classification(self, complaint_pk: int, ai_result: Dict) -> None:
+        """
+        Store AI category, severity and the matching department for a
+        complaint. Caller commits.
+        """
+        db.session.execute(
+            update(Complaint).where(Complaint.id == complaint_pk).values(
+                category=ai_result['category'],
+                ai_category=ai_result['ai_category'],
+                category_confidence=ai_result['confidence'],
+                severity_score=ai_result['severity_score'],
+                priority=ai_result['priority'],
+                department=self.get_department_for_category(ai_result['category'])
+            )
+        )
+    
+    def classify_unclassified(self, ai_service) -> int:
+        """
+        Backfill complaints whose background classification never finished
+        (ai_category is still NULL). Returns number of classified complaints.
+        """
+        rows = db.session.execute(
+            select(
+                Complaint.id,
+                Complaint.description,
+                Complaint.category,
+                Complaint.latitude,
+                Complaint.longitude
+            ).where(Complaint.ai_category.is_(None))
         ).all()
         
-        escalated_count = 0
-        for complaint in pending:
-            if self.check_escalation(complaint):
-                escalated_count += 1
+        for row in rows:
+            ai_result = ai_service.process_complaint(
+                text=row.description,
+                # 'other' is the placeholder for citizens who gave no category
+                category=row.category if row.category != 'other' else None,
+                latitude=row.latitude,
+                longitude=row.longitude,
+                complaint_pk=row.id
+            )
+            self.apply_classification(row.id, ai_result)
         
         db.session.commit()
-        return escalated_count
+        return len(rows)
     
     def get_workload_summary(self) -> Dict:
         """
@@ -215,19 +415,26 @@ class ComplaintService:
             for dept in departments if dept.department
         }
     
+    def refresh_analytics_views(self) -> None:
+        """
+        Refresh the pre-aggregated analytics views without blocking readers
+        """
+        db.session.execute(text('REFRESH MATERIALIZED VIEW CONCURRENTLY mv_complaints_daily'))
+        db.session.execute(text('REFRESH MATERIALIZED VIEW CONCURRENTLY mv_officer_daily'))
+        db.session.commit()
+    
     def close_stale_resolved(self, days_threshold: int = 7) -> int:
         """
         Auto-close complaints that have been resolved for X days
         """
         threshold = datetime.utcnow() - timedelta(days=days_threshold)
         
-        stale_complaints = Complaint.query.filter(
-            Complaint.status == 'resolved',
-            Complaint.resolved_at < threshold
-        ).all()
-        
-        for complaint in stale_complaints:
-            complaint.status = 'closed'
+        result = db.session.execute(
+            update(Complaint)
+            .where(Complaint.status == 'resolved', Complaint.resolved_at < threshold)
+            .values(status='closed')
+            .execution_options(synchronize_session=False)
+        )
         
         db.session.commit()
-        return len(stale_complaints)
+        return result.rowcount
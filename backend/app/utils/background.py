@@ -0,0 +1,33 @@
+"""
+Background execution
+Runs work off the request thread inside the current process
+"""
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from flask import current_app
+
+# bcrypt and database I/O release the GIL, so threads give real parallelism
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BACKGROUND_WORKERS', os.cpu_count() or 2)),
+    thread_name_prefix='civiclens-bg'
+)
+
+
+def run_in_background(fn: Callable, *args, **kwargs) -> Future:
+    """
+    Submit fn to the background pool, running it inside an app context
+    Failures are logged rather than raised, since no request is waiting on them
+    """
+    app = current_app._get_current_object()
+    
+    def task():
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                app.logger.exception('Background task %s failed', getattr(fn, '__name__', fn))
+                raise
+    
+    return _executor.submit(task)
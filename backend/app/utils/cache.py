@@ -0,0 +1,128 @@
+"""
+Response cache helpers
+Cache keys and invalidation shared across blueprints
+"""
+import threading
+import time
+
+from cachetools import TTLCache
+
+from app import cache, db
+from app.models.models import User
+
+DASHBOARD_CACHE_KEY = 'admin_dashboard'
+
+
+OFFICER_DASHBOARD_TIMEOUT = 30
+USER_CACHE_TIMEOUT = 60
+TRACK_CACHE_TIMEOUT = 300
+
+# Per-process (role, department, is_active) for authenticated requests, in
+# front of the shared user cache; other workers see changes within the TTL
+_USER_CLAIMS = TTLCache(maxsize=10_000, ttl=30)
+_USER_CLAIMS_LOCK = threading.Lock()
+
+
+def officer_dashboard_key(officer_id):
+    """Cache key for an officer's personal dashboard"""
+    return f"dash:{officer_id}"
+
+
+def officer_performance_key(officer_id, days):
+    """
+    Cache key for an officer's performance metrics over a period
+    Not invalidated on writes: the stats come from mv_officer_daily, so they
+    only change on refresh-analytics and simply expire with the TTL
+    """
+    return f"perf:{officer_id}:{days}"
+
+
+def invalidate_dashboard():
+    """Drop the cached admin dashboard after complaints change"""
+    cache.delete(DASHBOARD_CACHE_KEY)
+
+
+def invalidate_officer_dashboard(*officer_ids):
+    """Drop cached officer dashboards (not performance stats) after their complaints change"""
+    keys = [officer_dashboard_key(oid) for oid in officer_ids if oid]
+    if keys:
+        cache.delete_many(*keys)
+
+
+def revoked_token_key(jti):
+    """Cache key marking a revoked JWT"""
+    return f"rev:{jti}"
+
+
+def revoke_token(jti, expires_at):
+    """Mark a token as revoked until it would have expired anyway"""
+    ttl = int(expires_at - time.time())
+    if ttl > 0:
+        cache.set(revoked_token_key(jti), 1, timeout=ttl)
+
+
+def is_token_revoked(jti):
+    """Check whether a token has been revoked"""
+    return cache.has(revoked_token_key(jti))
+
+
+def user_cache_key(user_id):
+    """Cache key for a user's serialized profile"""
+    return f"user:{user_id}"
+
+
+def get_user_cached(user_id):
+    """
+    Get a user's to_dict() payload, hitting the database at most once a minute
+    Returns None if the user does not exist
+    """
+    key = user_cache_key(user_id)
+    data = cache.get(key)
+    if data is None:
+        user = db.session.get(User, user_id)
+        if not user:
+            return None
+        data = user.to_dict()
+        cache.set(key, data, timeout=USER_CACHE_TIMEOUT)
+    return data
+
+
+def get_user_claims(user_id):
+    """
+    Get a user's role, department and active flag for authorization checks
+    Served from process memory; returns None if the user does not exist
+    """
+    with _USER_CLAIMS_LOCK:
+        claims = _USER_CLAIMS.get(user_id)
+    if claims is not None:
+        return claims
+    
+    user = get_user_cached(user_id)
+    if user is None:
+        return None
+    claims = {
+        'role': user['role'],
+        'department': user['department'],
+        'is_active': user['is_active']
+    }
+    with _USER_CLAIMS_LOCK:
+        _USER_CLAIMS[user_id] = claims
+    return claims
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached profile after it changes"""
+    cache.delete(user_cache_key(user_id))
+    with _USER_CLAIMS_LOCK:
+        _USER_CLAIMS.pop(user_id, None)
+
+
+def track_cache_key(complaint_id):
+    """Cache key for a complaint's public tracking payload"""
+    return f"track:{complaint_id}"
+
+
+def invalidate_track(*complaint_ids):
+    """Drop cached tracking payloads after complaints or their history change"""
+    if complaint_ids:
+        cache.delete_many(*[track_cache_key(cid) for cid in complaint_ids])
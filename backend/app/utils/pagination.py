@@ -0,0 +1,62 @@
+"""
+Complaint list pagination
+Keyset (seek) pagination over the (severity_score, created_at, id) sort key,
+with classic page numbers kept for existing clients
+"""
+import base64
+import binascii
+from datetime import datetime
+from sqlalchemy import tuple_
+from app.models.models import Complaint
+
+# Matches ix_complaints_severity_created_id
+COMPLAINT_ORDER = (
+    Complaint.severity_score.desc(),
+    Complaint.created_at.desc(),
+    Complaint.id.desc()
+)
+
+
+def encode_cursor(complaint):
+    """Encode a complaint's sort key as an opaque cursor"""
+    raw = f"{complaint.severity_score}|{complaint.created_at.isoformat()}|{complaint.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (severity_score, created_at, id); None if malformed"""
+    try:
+        severity, created_at, complaint_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return float(severity), datetime.fromisoformat(created_at), int(complaint_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def paginate_complaints(query, page, per_page, after=None):
+    """
+    Paginate a complaint query in severity order.
+    With an `after` cursor, seek past it instead of using OFFSET, so deep
+    pages cost the same as the first one. Returns the response fields.
+    """
+    query = query.order_by(*COMPLAINT_ORDER)
+    
+    if after is None:
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        items = pagination.items
+        result = {
+            'total': pagination.total,
+            'pages': pagination.pages,
+            'current_page': page
+        }
+    else:
+        key = decode_cursor(after)
+        if key is None:
+            raise ValueError('Invalid cursor')
+        items = query.filter(
+            tuple_(Complaint.severity_score, Complaint.created_at, Complaint.id) < tuple_(*key)
+        ).limit(per_page).all()
+        result = {}
+    
+    result['complaints'] = [c.to_dict() for c in items]
+    result['next_cursor'] = encode_cursor(items[-1]) if len(items) == per_page else None
+    return result
@@ -0,0 +1,113 @@
+"""
+Password security helpers
+Hashing and verification shared by the auth and admin routes
+"""
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+from flask import current_app
+
+from app import bcrypt
+
+# New hashes use Argon2id; its lanes hash in parallel across cores. Existing
+# bcrypt hashes still verify and are upgraded on the next successful login.
+# The work factor comes from config (ARGON2_*), cheaper outside production.
+_ARGON2_DEFAULTS = {'time_cost': 2, 'memory_cost': 64 * 1024, 'parallelism': 4}
+_ARGON2_HASHERS = {}
+_ARGON2_PREFIX = '$argon2'
+
+# Successful verifications keyed by (hash, keyed digest of the password), so
+# repeat logins skip the key derivation. The plaintext is never stored,
+# and the per-process key keeps the digests useless outside this process.
+_VERIFIED_CACHE = TTLCache(maxsize=10_000, ttl=300)
+_VERIFIED_LOCK = threading.Lock()
+_DIGEST_KEY = os.urandom(32)
+
+
+def _argon2() -> PasswordHasher:
+    """Argon2 hasher for the current app's work factor (defaults outside an app)"""
+    try:
+        config = current_app.config
+        params = tuple(
+            config.get(f'ARGON2_{name.upper()}', default) for name, default in _ARGON2_DEFAULTS.items()
+        )
+    except RuntimeError:
+        params = tuple(_ARGON2_DEFAULTS.values())
+    
+    hasher = _ARGON2_HASHERS.get(params)
+    if hasher is None:
+        hasher = _ARGON2_HASHERS.setdefault(params, PasswordHasher(**dict(zip(_ARGON2_DEFAULTS, params))))
+    return hasher
+
+
+def hash_password(password: str) -> str:
+    """
+    Hash a password for storage
+    argon2 releases the GIL while hashing, so concurrent requests on a
+    threaded worker hash in parallel without a separate process pool
+    """
+    return _argon2().hash(password)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """
+    Hash a batch of passwords (seeding, bulk user imports) concurrently
+    Each hash still gets its own random salt
+    """
+    # Resolved here, since the pool threads have no app context
+    hasher = _argon2()
+    if len(passwords) < 2:
+        return [hasher.hash(p) for p in passwords]
+    with ThreadPoolExecutor(max_workers=min(len(passwords), os.cpu_count() or 2)) as pool:
+        return list(pool.map(hasher.hash, passwords))
+
+
+def needs_rehash(pw_hash: str) -> bool:
+    """Whether a stored hash predates the current Argon2 parameters"""
+    if not pw_hash.startswith(_ARGON2_PREFIX):
+        return True
+    return _argon2().check_needs_rehash(pw_hash)
+
+
+def _verify(pw_hash: str, password: str) -> bool:
+    if pw_hash.startswith(_ARGON2_PREFIX):
+        try:
+            return _argon2().verify(pw_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return bcrypt.check_password_hash(pw_hash, password)
+
+
+def _cache_key(pw_hash: str, password: str) -> tuple:
+    digest = hmac.new(_DIGEST_KEY, password.encode('utf-8'), hashlib.sha256).digest()
+    return (pw_hash, digest)
+
+
+def check_password(pw_hash: str, password: str) -> bool:
+    """Verify a password against its Argon2 or legacy bcrypt hash, reusing recent successes"""
+    key = _cache_key(pw_hash, password)
+    
+    with _VERIFIED_LOCK:
+        if key in _VERIFIED_CACHE:
+            return True
+    
+    if not _verify(pw_hash, password):
+        return False
+    
+    with _VERIFIED_LOCK:
+        _VERIFIED_CACHE[key] = True
+    return True
+
+
+def forget_password_hash(pw_hash: str) -> None:
+    """Drop cached verifications for a hash that is being replaced"""
+    with _VERIFIED_LOCK:
+        for key in [k for k in _VERIFIED_CACHE.keys() if k[0] == pw_hash]:
+            _VERIFIED_CACHE.pop(key, None)
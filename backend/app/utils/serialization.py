@@ -0,0 +1,46 @@
+"""
+JSON serialization
+orjson-backed JSON provider used by jsonify and request parsing
+"""
+import dataclasses
+import decimal
+import uuid
+from typing import Any, Union
+
+import orjson
+from flask.json.provider import JSONProvider
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(o: Any) -> Any:
+    """Serialize types orjson does not handle natively, matching Flask's defaults"""
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Encode an object to JSON bytes"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONProvider(JSONProvider):
+    """
+    JSON provider using orjson for encoding and decoding
+    Installed as app.json so every jsonify() call goes through it
+    """
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_bytes(obj).decode('utf-8')
+    
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype='application/json')
@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for serving wsgi:app
+Loaded automatically when gunicorn starts from the backend directory
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Preforked workers, each with a thread pool for I/O-bound requests. Keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under Postgres max_connections.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+timeout = 30
+keepalive = 5
@@ -1,8 +1,9 @@
 """
 CivicLens Backend Entry Point
 """
+import os
+
 from app import create_app, db
-from app.models.models import User, Complaint, StatusUpdate, Department, ImportantLocation
 
 app = create_app()
 
@@ -10,6 +11,8 @@ app = create_app()
 @app.shell_context_processor
 def make_shell_context():
     """Make database models available in Flask shell"""
+    from app.models.models import User, Complaint, StatusUpdate, Department, ImportantLocation
+    
     return {
         'db': db,
         'User': User,
@@ -24,18 +27,21 @@ def make_shell_context():
 def init_db():
     """Initialize the database with tables and default data"""
     import click
+    from sqlalchemy import insert
+    from app.models.models import User, Department, upgrade_schema
     
     db.create_all()
+    upgrade_schema()
     click.echo('Database tables created.')
     
     # Create default admin user
-    from app import bcrypt
+    from app.utils.security import hash_password
     
     admin = User.query.filter_by(email='admin@civiclens.gov').first()
     if not admin:
         admin = User(
             email='admin@civiclens.gov',
-            password_hash=bcrypt.generate_password_hash('admin123').decode('utf-8'),
+            password_hash=hash_password('admin123'),
             first_name='System',
             last_name='Administrator',
             role='admin',
@@ -56,11 +62,14 @@ def init_db():
         {'name': 'General Administration', 'code': 'GEN', 'categories': ['other']},
     ]
     
-    for dept_data in default_departments:
-        dept = Department.query.filter_by(code=dept_data['code']).first()
-        if not dept:
-            dept = Department(**dept_data)
-            db.session.add(dept)
+    # One lookup for all existing codes, then insert only the difference
+    existing_codes = {code for (code,) in db.session.query(Department.code)}
+    missing_departments = [
+        dept_data for dept_data in default_departments
+        if dept_data['code'] not in existing_codes
+    ]
+    if missing_departments:
+        db.session.execute(insert(Department), missing_departments)
     
     db.session.commit()
     click.echo('Default departments created.')
@@ -70,42 +79,59 @@ def init_db():
 def create_demo_data():
     """Create demo data for testing"""
     import click
+    import os
     import random
+    import sys
     from datetime import datetime, timedelta
-    from app import bcrypt
+    import numpy as np
+    from sqlalchemy import text
+    from app.models.models import User
+    from app.utils.security import hash_passwords
     
     # Create demo officers
     officers = []
+    new_users = []
     departments = ['Public Works Department', 'Water Supply Department', 'Sanitation Department']
     
+    # Existing demo accounts, fetched in one query
+    demo_emails = [f'officer{i+1}@civiclens.gov' for i in range(len(departments))] + ['citizen@example.com']
+    existing_users = {
+        user.email: user for user in User.query.filter(User.email.in_(demo_emails))
+    }
+    
     for i, dept in enumerate(departments):
-        officer = User.query.filter_by(email=f'officer{i+1}@civiclens.gov').first()
+        officer = existing_users.get(f'officer{i+1}@civiclens.gov')
         if not officer:
             officer = User(
                 email=f'officer{i+1}@civiclens.gov',
-                password_hash=bcrypt.generate_password_hash('officer123').decode('utf-8'),
                 first_name=f'Officer',
                 last_name=f'{i+1}',
                 role='officer',
                 department=dept,
                 is_active=True
             )
-            db.session.add(officer)
+            new_users.append((officer, 'officer123'))
             officers.append(officer)
     
     # Create demo citizen
-    citizen = User.query.filter_by(email='citizen@example.com').first()
+    citizen = existing_users.get('citizen@example.com')
     if not citizen:
         citizen = User(
             email='citizen@example.com',
-            password_hash=bcrypt.generate_password_hash('citizen123').decode('utf-8'),
             first_name='Demo',
             last_name='Citizen',
             role='citizen',
             is_active=True
         )
-        db.session.add(citizen)
+        new_users.append((citizen, 'citizen123'))
+    
+    # Hash all new passwords in one concurrent batch
+    hashes = hash_passwords([password for _, password in new_users])
+    for (user, _), password_hash in zip(new_users, hashes):
+        user.password_hash = password_hash
     
+    # Flushed together as one batched INSERT
+    db.session.add_all([user for user, _ in new_users])
     db.session.commit()
     
     # Create demo complaints
@@ -116,41 +142,100 @@ def create_demo_data():
     # Delhi area coordinates
     base_lat, base_lng = 28.6139, 77.2090
     
-    for i in range(50):
-        days_ago = random.randint(0, 30)
-        created = datetime.utcnow() - timedelta(days=days_ago)
-        
-        category = random.choice(categories)
-        status = random.choice(statuses)
-        priority = random.choice(priorities)
-        
-        lat = base_lat + random.uniform(-0.1, 0.1)
-        lng = base_lng + random.uniform(-0.1, 0.1)
-        
-        year = datetime.utcnow().year
-        complaint = Complaint(
-            complaint_id=f'CL-{year}-{1000+i:06d}',
-            user_id=citizen.id,
-            title=f'Demo {category} complaint #{i+1}',
-            description=f'This is a demo {category} complaint for testing purposes. The issue is {priority} priority.',
-            category=category,
-            latitude=lat,
-            longitude=lng,
-            status=status,
-            priority=priority,
-            severity_score=random.uniform(0.2, 1.0),
-            department=departments[categories.index(category)],
-            created_at=created
+    # Loop invariants; DEMO_SEED makes the generated data reproducible
+    count = 50
+    now = datetime.utcnow()
+    cat_to_dept = dict(zip(categories, departments))
+    descriptions = {
+        (category, priority): sys.intern(
+            f'This is a demo {category} complaint for testing purposes. The issue is {priority} priority.'
         )
+        for category in categories for priority in priorities
+    }
+    seed = int(os.environ['DEMO_SEED']) if os.environ.get('DEMO_SEED') else None
+    rng = random.Random(seed)
+    
+    # Draw the categorical columns for every row up front
+    days_ago_list = [rng.randint(0, 30) for _ in range(count)]
+    category_list = rng.choices(categories, k=count)
+    status_list = rng.choices(statuses, k=count)
+    priority_list = rng.choices(priorities, k=count)
+    coords = np.array([base_lat, base_lng]) + np.random.default_rng(seed).uniform(-0.1, 0.1, size=(count, 2))
+    
+    rows = []
+    for i, (days_ago, category, status, priority, (lat, lng)) in enumerate(
+        zip(days_ago_list, category_list, status_list, priority_list, coords.tolist())
+    ):
+        created = now - timedelta(days=days_ago)
         
-        if status == 'resolved':
-            complaint.resolved_at = created + timedelta(hours=random.randint(1, 72))
-        
-        db.session.add(complaint)
+        rows.append({
+            'user_id': citizen.id,
+            'title': f'Demo {category} complaint #{i+1}',
+            'description': descriptions[category, priority],
+            'category': category,
+            'latitude': lat,
+            'longitude': lng,
+            'status': status,
+            'priority': priority,
+            'severity_score': rng.uniform(0.2, 1.0),
+            'department': cat_to_dept[category],
+            'created_at': created,
+            'updated_at': created,
+            'resolved_at': (
+                created + timedelta(hours=rng.randint(1, 72)) if status == 'resolved' else None
+            ),
+            'is_duplicate': False,
+            'escalation_level': 0
+        })
     
+    # Stream the rows with COPY into a staging table, then move them over in
+    # one INSERT ... SELECT that builds the PostGIS point server-side; the
+    # complaint_id default numbers them from complaint_counters
+    columns = ', '.join(rows[0])
+    db.session.execute(text(
+        f'CREATE TEMP TABLE demo_complaints ON COMMIT DROP AS '
+        f'SELECT {columns} FROM complaints WITH NO DATA'
+    ))
+    driver_connection = db.session.connection().connection.driver_connection
+    with driver_connection.cursor() as cursor:
+        with cursor.copy(f'COPY demo_complaints ({columns}) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(tuple(row.values()))
+    db.session.execute(text(
+        f'INSERT INTO complaints ({columns}, location) '
+        f'SELECT {columns}, CAST(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) AS geography) '
+        f'FROM demo_complaints'
+    ))
     db.session.commit()
-    click.echo('Demo data created: 50 complaints, 3 officers, 1 citizen')
+    click.echo(f'Demo data created: {count} complaints, 3 officers, 1 citizen')
+
+
+@app.cli.command('refresh-analytics')
+def refresh_analytics():
+    """Refresh pre-aggregated analytics views (schedule via cron)"""
+    import click
+    from app.services.complaint_service import ComplaintService
+    
+    ComplaintService().refresh_analytics_views()
+    click.echo('Analytics views refreshed.')
+
+
+@app.cli.command('rescore-complaints')
+def rescore_complaints():
+    """Classify missed complaints and recompute open complaint scores (schedule via cron)"""
+    import click
+    from app.services.ai_service import AIService
+    from app.services.complaint_service import ComplaintService
+    
+    complaint_service = ComplaintService()
+    ai_service = AIService()
+    classified = complaint_service.classify_unclassified(ai_service)
+    rescored = complaint_service.rescore_open_complaints(ai_service)
+    click.echo(f'Classified {classified} pending complaints; rescored {rescored} open complaints.')
 
 
 if __name__ == '__main__':
+    # Development server only; production serves wsgi:app through gunicorn
+    if os.environ.get('FLASK_ENV', 'development') == 'production':
+        raise SystemExit('Refusing to start the development server in production; run: gunicorn wsgi:app')
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,5 @@
+"""
+CivicLens WSGI Entry Point
+Serve with gunicorn (settings in gunicorn.conf.py): gunicorn wsgi:app
+"""
+from run import app  # noqa: F401
@@ -4,6 +4,9 @@
 -- Enable PostGIS
 CREATE EXTENSION IF NOT EXISTS postgis;
 
+-- Trigram matching for user search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Create geometry columns helper
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 